@@ -7,44 +7,60 @@ import os
 import shutil
 import sys
 
-from data.data_utils import data_division
-from data.data_preprocess import data_preprocess
+from data.data_cache import cached_data_division
+from data.data_view import DataView, save_npy
 from metrics.metric_utils import reidentify_score
 
 
 MAX_SEQ_LEN = 100
 SEED = 0
 TRAIN_RATE = 0.8
+DTYPE = np.float32
 DEFAULT_IMAGE = "tavianator/hide-and-seek-codalab"
 
 
-def _load_data(path):
-    ori_data = data_preprocess(path, MAX_SEQ_LEN)
+def _load_data(path, cache_dir):
+    divided_data, _ = cached_data_division(path, MAX_SEQ_LEN, seed = SEED, divide_rates = [TRAIN_RATE, 1-TRAIN_RATE], cache_dir = cache_dir, dtype = DTYPE)
 
-    divided_data, _ = data_division(ori_data, seed = SEED, divide_rates = [TRAIN_RATE, 1-TRAIN_RATE])
-
-    train_data = np.asarray(divided_data[0])
-    test_data = np.asarray(divided_data[1])
+    train_data, test_data = divided_data
 
     return train_data, test_data
 
 
+def _save_arrays(path, **arrays):
+    """Save each array as an uncompressed .npy file, so it can be memory-mapped."""
+    os.makedirs(path, exist_ok=True)
+    for name, array in arrays.items():
+        save_npy(os.path.join(path, name + ".npy"), array)
+
+
+def _load_array(path, name):
+    """Memory-map a saved array read-only (shared through the page cache across containers)."""
+    return np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+
+
 def _run_hider(args):
     from hider import hider
 
     print("Loading data...")
     data_path = os.path.join(args.opt_dir, "data", "train_longitudinal_data.csv")
-    train_data, test_data = _load_data(data_path)
+    train_data, test_data = _load_data(data_path, os.path.join(args.opt_dir, "cache"))
 
     print("Running hider...")
     generated_data = hider(train_data)
     print("Hider done")
 
-    enlarge_data = np.concatenate((train_data, test_data), axis = 0)
-    enlarge_data_label = np.concatenate((np.ones([train_data.shape[0],]), np.zeros([test_data.shape[0],])), axis = 0)
+    # A view over train and test data, written to enlarge_data.npy batch by batch
+    enlarge_data = DataView([train_data, test_data])
+    enlarge_data_label = np.concatenate((np.ones([train_data.shape[0],], dtype = DTYPE), np.zeros([test_data.shape[0],], dtype = DTYPE)), axis = 0)
 
-    np.savez(
-        os.path.join(args.opt_dir, "hiders", args.user, "data.npz"),
+    # Mix the order once here, so every seeker can memory-map enlarge_data as is
+    idx = np.random.permutation(enlarge_data.shape[0])
+    enlarge_data = enlarge_data.subset(idx)
+    enlarge_data_label = enlarge_data_label[idx]
+
+    _save_arrays(
+        os.path.join(args.opt_dir, "hiders", args.user, "data"),
         train_data=train_data,
         test_data=test_data,
         generated_data=generated_data,
@@ -58,30 +74,16 @@ def _run_seeker(args):
     from seeker import seeker
 
     print("Loading data...")
-    data_path = os.path.join(args.opt_dir, "hiders", args.vs, "data.npz")
-    with np.load(data_path) as data:
-        train_data = data['train_data']
-        test_data = data['test_data']
-        generated_data = data['generated_data']
-        enlarge_data = data['enlarge_data']
-        enlarge_data_label = data['enlarge_data_label']
-
-    # Mix the order
-    idx = np.random.permutation(enlarge_data.shape[0])
-    enlarge_data = enlarge_data[idx]
-    enlarge_data_label = enlarge_data_label[idx]
+    data_path = os.path.join(args.opt_dir, "hiders", args.vs, "data")
+    generated_data = _load_array(data_path, "generated_data")
+    enlarge_data = _load_array(data_path, "enlarge_data")
 
     print("Running seeker...")
     reidentified_data = seeker(generated_data, enlarge_data)
     print("Seeker done")
 
-    np.savez(
-        os.path.join(args.opt_dir, "seekers", args.user, "vs", args.vs, "data.npz"),
-        train_data=train_data,
-        test_data=test_data,
-        generated_data=generated_data,
-        enlarge_data=enlarge_data,
-        enlarge_data_label=enlarge_data_label,
+    _save_arrays(
+        os.path.join(args.opt_dir, "seekers", args.user, "vs", args.vs, "data"),
         reidentified_data=reidentified_data,
     )
     print("Saved seeker output")
@@ -127,7 +129,7 @@ def _dockerize_vs(client, runtime, args, seeker, hider):
 
     os.makedirs(vs_dir, exist_ok=True)
 
-    hider_data = os.path.join(args.opt_dir, "hiders", hider, "data.npz")
+    hider_data = os.path.join(args.opt_dir, "hiders", hider, "data", "enlarge_data_label.npy")
     hider_mtime = os.path.getmtime(hider_data)
     score_file = os.path.join(vs_dir, "score.txt")
     if os.path.exists(score_file):
@@ -200,10 +202,8 @@ def _dockerize_vs(client, runtime, args, seeker, hider):
 
     print("Computing reidentification score...")
 
-    seeker_data = os.path.join(vs_dir, "data.npz")
-    with np.load(seeker_data) as data:
-        enlarge_data_label = data['enlarge_data_label']
-        reidentified_data = data['reidentified_data']
+    enlarge_data_label = _load_array(os.path.dirname(hider_data), "enlarge_data_label")
+    reidentified_data = _load_array(os.path.join(vs_dir, "data"), "reidentified_data")
 
     reidentification_score = reidentify_score(enlarge_data_label, reidentified_data)
     with open(score_file, "w") as f:
@@ -258,6 +258,11 @@ def _dockerize_hider(client, runtime, args):
         "/opt/hide-and-seek",
     ]
 
+    # The container mounts opt_dir read-only, so fill the preprocessed data cache here
+    print("Preprocessing data...")
+    data_path = os.path.join(args.opt_dir, "data", "train_longitudinal_data.csv")
+    _load_data(data_path, os.path.join(args.opt_dir, "cache"))
+
     image = _docker_image(code_dir)
 
     print("Pulling {}...".format(image))
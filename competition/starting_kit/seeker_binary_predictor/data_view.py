@@ -0,0 +1 @@
+../../../data/data_view.py
\ No newline at end of file
@@ -0,0 +1 @@
+../../../seeker/decision.py
\ No newline at end of file
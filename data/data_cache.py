@@ -0,0 +1,137 @@
+"""Hide-and-Seek Privacy Challenge Codebase.
+
+Reference: James Jordon, Daniel Jarrett, Jinsung Yoon, Ari Ercole, Cheng Zhang, Danielle Belgrave, Mihaela van der Schaar,
+"Hide-and-Seek Privacy Challenge: Synthetic Data Generation vs. Patient Re-identification with Clinical Time-series Data,"
+Neural Information Processing Systems (NeurIPS) Competition, 2020.
+
+Link: https://www.vanderschaar-lab.com/announcing-the-neurips-2020-hide-and-seek-privacy-challenge/
+
+Last updated Date: June 21th 2020
+Code author: Jinsung Yoon
+Contact: jsyoon0823@gmail.com
+
+-----------------------------
+
+data_cache.py
+
+(1) file_hash: SHA-256 hash of the file content
+(2) cache_key: Key of the cache entry for a CSV file and preprocessing parameters
+(3) cached_data_division: Preprocess and divide the data, reusing the on-disk cache
+
+Each cache entry is a directory named by its key (renamed into place once complete) with:
+  - processed_data.npy: preprocessed data
+  - index_<i>.npy: index of the i-th division
+  - manifest.json: parameters of the entry
+"""
+
+## Necessary Packages
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+
+from data.data_preprocess import data_preprocess
+from data.data_utils import data_division
+
+
+# Bump when the preprocessing output changes
+CACHE_VERSION = 1
+
+
+def file_hash(file_name, block_size = 1 << 20):
+  """SHA-256 hash of the file content.
+
+  Args:
+    - file_name: file name
+    - block_size: the number of bytes read at a time
+
+  Returns:
+    - hex_digest: hash of the file content
+  """
+  hash_fn = hashlib.sha256()
+  with open(file_name, 'rb') as f:
+    for block in iter(lambda: f.read(block_size), b''):
+      hash_fn.update(block)
+  return hash_fn.hexdigest()
+
+
+def cache_key(manifest):
+  """Key of the cache entry for a CSV file and preprocessing parameters.
+
+  Args:
+    - manifest: file hash and preprocessing parameters (dict)
+
+  Returns:
+    - key: hex digest identifying the cache entry
+  """
+  return hashlib.sha256(json.dumps(manifest, sort_keys = True).encode()).hexdigest()
+
+
+def cached_data_division(file_name, max_seq_len, seed, divide_rates, cache_dir, chunk_size = None, dtype = np.float32, workers = 1):
+  """Preprocess and divide the data, reusing the on-disk cache.
+
+  The cache entry is keyed by the CSV content hash and all parameters that change
+  the output. If cache_dir is not writable (e.g. a read-only mount), the data is
+  still returned but not saved.
+
+  Args:
+    - file_name: CSV file name
+    - max_seq_len: maximum sequence length
+    - seed: random seed
+    - divide_rates: ratio for each division
+    - cache_dir: cache directory (None to disable the cache)
+    - chunk_size: the number of CSV rows read at a time (see data_preprocess)
+    - dtype: data type of the preprocessed data
+    - workers: the number of preprocessing processes (does not change the output, so not in the key)
+
+  Returns:
+    - divided_data: divided data (arrays)
+    - divided_index: divided data index (list of index arrays)
+  """
+  if cache_dir is None:
+    ori_data = data_preprocess(file_name, max_seq_len, chunk_size, dtype, workers = workers)
+    return data_division(ori_data, seed, divide_rates)
+
+  manifest = {'version': CACHE_VERSION,
+              'file_hash': file_hash(file_name),
+              'max_seq_len': max_seq_len,
+              'seed': seed,
+              'divide_rates': list(divide_rates),
+              'chunk_size': chunk_size,
+              'dtype': np.dtype(dtype).name}
+  entry_dir = os.path.join(cache_dir, cache_key(manifest))
+
+  # Cache hit
+  if os.path.exists(os.path.join(entry_dir, 'manifest.json')):
+    # Memory-mapped, so only the rows of each division are read
+    ori_data = np.load(os.path.join(entry_dir, 'processed_data.npy'), mmap_mode = 'r')
+    divided_index = [np.load(os.path.join(entry_dir, 'index_{}.npy'.format(i)))
+                     for i in range(len(divide_rates))]
+    divided_data = [ori_data[idx] for idx in divided_index]
+    return divided_data, divided_index
+
+  # Cache miss
+  ori_data = data_preprocess(file_name, max_seq_len, chunk_size, dtype, workers = workers)
+  divided_data, divided_index = data_division(ori_data, seed, divide_rates)
+
+  # Save the entry in a temporary directory first, so readers never see a partial entry
+  try:
+    os.makedirs(cache_dir, exist_ok = True)
+    tmp_dir = tempfile.mkdtemp(dir = cache_dir)
+  except OSError:
+    return divided_data, divided_index
+
+  try:
+    np.save(os.path.join(tmp_dir, 'processed_data.npy'), ori_data)
+    for i, idx in enumerate(divided_index):
+      np.save(os.path.join(tmp_dir, 'index_{}.npy'.format(i)), idx)
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+      json.dump(dict(manifest, shape = list(ori_data.shape)), f, indent = 2)
+    os.rename(tmp_dir, entry_dir)
+  except OSError:
+    # Another process saved the same entry first
+    shutil.rmtree(tmp_dir, ignore_errors = True)
+
+  return divided_data, divided_index
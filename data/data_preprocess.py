@@ -13,34 +13,52 @@ Contact: jsyoon0823@gmail.com
 -----------------------------
 
 (1) data_preprocess: Load the data and preprocess for 3d numpy array
-(2) imputation: Impute missing data using bfill, ffill and median imputation
+(2) parallel_data_preprocess: Preprocess the admissions in a process pool, sharded by admissionid
+(3) shard_preprocess: Preprocess a shard of admissions into the memory-mapped output
+(4) chunked_data_preprocess: Load the data in chunks and preprocess with bounded memory
+(5) chunk_statistics: Collect the MinMax statistics, admission sizes and quantile summaries
+(6) chunked_fill: Preprocess each admission as soon as all of its rows are read
+(7) incremental_data_preprocess: Preprocess only the new admissions and append them
+(8) minmax_rescale: Rescale preprocessed data from old to new MinMax statistics
+(9) approximate_median: Merge per-chunk quantile summaries into approximate medians
+(10) admission_preprocess: Sort the rows by admission, then preprocess time, impute and scale
+(11) padding_index: Map the rows of the grouped data to their front-padded positions
+(12) imputation: Impute missing data using bfill, ffill and median imputation
 """
 
 ## Necessary packages
+import os
+import shutil
+import tempfile
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
-from tqdm import tqdm
 from sklearn.preprocessing import MinMaxScaler
+from data.ragged import RaggedData
 import warnings
 warnings.filterwarnings("ignore")
 
-def data_preprocess(file_name, max_seq_len):
+def data_preprocess(file_name, max_seq_len, chunk_size = None, dtype = np.float32, ragged = False, workers = 1):
   """Load the data and preprocess for 3d numpy array.
   
   Args:
     - file_name: CSV file name
     - max_seq_len: maximum sequence length
+    - chunk_size: if set, read the CSV in chunks of this many rows (see chunked_data_preprocess)
+    - dtype: data type of the preprocessed data
+    - ragged: return RaggedData (without padding) instead of a front-padded 3d array
+    - workers: the number of processes (see parallel_data_preprocess, in-memory path only)
     
   Returns:
     - processed_data: preprocessed data
   """
+  if chunk_size is not None:
+    return chunked_data_preprocess(file_name, max_seq_len, chunk_size, dtype = dtype, ragged = ragged)
 
   # Load data  
   ori_data = pd.read_csv(file_name)
   
   # Parameters
-  uniq_id = np.unique(ori_data['admissionid'])
-  no = len(uniq_id)
   dim = len(ori_data.columns) - 1
   median_vals = ori_data.median()
 
@@ -48,39 +66,454 @@ def data_preprocess(file_name, max_seq_len):
   scaler = MinMaxScaler()
   scaler.fit(ori_data)
 
+  if workers > 1:
+    return parallel_data_preprocess(ori_data, median_vals, scaler, max_seq_len, workers, dtype, ragged)
+
+  # Sort, impute and scale all admissions
+  uniq_id, counts, scaled_data = admission_preprocess(ori_data, median_vals, scaler)
+  no = len(uniq_id)
+  row_idx, data_idx, time_idx = padding_index(counts, max_seq_len)
+
+  # Ragged data keeps the first max_seq_len rows of each admission (Excluding ID)
+  if ragged:
+    return RaggedData(scaled_data[row_idx, 1:].astype(dtype), np.minimum(counts, max_seq_len))
+
   # Output initialization
-  processed_data = -np.ones([no, max_seq_len, dim])
+  processed_data = np.full([no, max_seq_len, dim], -1.0, dtype = dtype)
+
+  # Assign to the preprocessed data (Excluding ID) in one scatter (scaled in float64, then cast)
+  processed_data[data_idx, time_idx, :] = scaled_data[row_idx, 1:]
+
+  return processed_data
+
+
+def parallel_data_preprocess(ori_data, median_vals, scaler, max_seq_len, workers, dtype = np.float32, ragged = False):
+  """Preprocess the admissions in a process pool, sharded by admissionid.
+  
+  Each worker preprocesses a contiguous range of admission ids (balanced by rows) 
+  and writes its rows directly into a memory-mapped output file, so no results are 
+  pickled back. The output is byte-identical to the serial path.
+  
+  Args:
+    - ori_data: pandas dataframe of all admissions
+    - median_vals: median values for each column
+    - scaler: fitted MinMax scaler
+    - max_seq_len: maximum sequence length
+    - workers: the number of processes
+    - dtype: data type of the preprocessed data
+    - ragged: return RaggedData (without padding) instead of a front-padded 3d array
+    
+  Returns:
+    - processed_data: preprocessed data
+  """
+  # Sort once by admissionid (stable, so the row order within each admission is kept)
+  sort_idx = np.argsort(ori_data['admissionid'].values, kind = 'mergesort')
+  ori_data = ori_data.iloc[sort_idx].reset_index(drop = True)
+  uniq_id, start_idx, counts = np.unique(ori_data['admissionid'].values, 
+                                         return_index = True, return_counts = True)
+  no = len(uniq_id)
+  dim = len(ori_data.columns) - 1
+  lengths = np.minimum(counts, max_seq_len)
+  
+  # Shard boundaries (admission index) with about the same number of rows
+  bounds = np.unique(np.searchsorted(start_idx, np.linspace(0, len(ori_data), workers + 1)))
+  bounds[-1] = no
+  
+  with tempfile.TemporaryDirectory() as tmpdir:
+    out_file = os.path.join(tmpdir, 'processed_data.npy')
+    out_shape = (int(np.sum(lengths)), dim) if ragged else (no, max_seq_len, dim)
+    np.lib.format.open_memmap(out_file, mode = 'w+', dtype = dtype, shape = out_shape).flush()
+    
+    with ProcessPoolExecutor(max_workers = len(bounds) - 1) as executor:
+      futures = list()
+      for first, last in zip(bounds[:-1], bounds[1:]):
+        if first == last:
+          continue
+        shard = ori_data.iloc[start_idx[first]:(start_idx[last - 1] + counts[last - 1])]
+        # Output position of the shard (admission index, or value row for ragged data)
+        out_start = int(np.sum(lengths[:first])) if ragged else int(first)
+        futures.append(executor.submit(shard_preprocess, shard, median_vals, scaler, 
+                                       max_seq_len, out_file, out_start, ragged))
+      for future in futures:
+        future.result()
+        
+    processed_data = np.load(out_file)
+  
+  if ragged:
+    return RaggedData(processed_data, lengths)
+  return processed_data
+
+
+def shard_preprocess(shard, median_vals, scaler, max_seq_len, out_file, out_start, ragged):
+  """Preprocess a shard of complete admissions and write it into the memory-mapped output.
   
-  # For each uniq id
-  for i in tqdm(range(no)):
-    # Extract the time-series data with a certain admissionid
-    idx = ori_data.index[ori_data['admissionid'] == uniq_id[i]]
-    curr_data = ori_data.iloc[idx]
+  Args:
+    - shard: pandas dataframe of a contiguous range of admissions
+    - median_vals: median values for each column
+    - scaler: fitted MinMax scaler
+    - max_seq_len: maximum sequence length
+    - out_file: memory-mapped output file (.npy)
+    - out_start: output position of the first admission of the shard
+    - ragged: the output is the values of RaggedData
+  """
+  uniq_id, counts, scaled_data = admission_preprocess(shard, median_vals, scaler)
+  row_idx, data_idx, time_idx = padding_index(counts, max_seq_len)
+  
+  processed_data = np.load(out_file, mmap_mode = 'r+')
+  if ragged:
+    processed_data[out_start:(out_start + len(row_idx))] = scaled_data[row_idx, 1:]
+  else:
+    curr_data = processed_data[out_start:(out_start + len(uniq_id))]
+    curr_data[:] = -1
+    curr_data[data_idx, time_idx, :] = scaled_data[row_idx, 1:]
+  processed_data.flush()
+
 
-    # Preprocess time
-    curr_data['time'] = curr_data['time'] - np.min(curr_data['time'])    
+def chunked_data_preprocess(file_name, max_seq_len, chunk_size, n_quantiles = 1001, dtype = np.float32, ragged = False):
+  """Load the data in chunks and preprocess for 3d numpy array with bounded memory.
+  
+  The CSV is read twice. The first pass collects the MinMax statistics, the number 
+  of rows of each admission and a quantile summary of each chunk for the medians.
+  The second pass preprocesses each admission as soon as all of its rows are read.
+  
+  The medians are approximate: the rank of each median is within 1/(n_quantiles-1) 
+  of the column size from the exact median (0.1% by default). The output only differs 
+  from the in-memory path where a feature is entirely missing in an admission.
+  Peak memory is bounded by the chunk size plus the output array as long as the 
+  rows of each admission are contiguous in the file.
+  
+  Args:
+    - file_name: CSV file name
+    - max_seq_len: maximum sequence length
+    - chunk_size: the number of rows in each chunk
+    - n_quantiles: the number of quantiles kept per chunk for the medians
+    - dtype: data type of the preprocessed data
+    - ragged: return RaggedData (without padding) instead of a front-padded 3d array
     
-    # Impute missing data
-    curr_data = imputation(curr_data, median_vals)
+  Returns:
+    - processed_data: preprocessed data
+  """
+  
+  ## Pass 1: statistics
+  scaler, uniq_id, counts, quantile_list, nonnan_list = chunk_statistics(file_name, chunk_size, n_quantiles)
+  
+  # Parameters
+  columns = scaler.feature_names_in_
+  no = len(uniq_id)
+  dim = len(columns) - 1
+  median_vals = pd.Series(approximate_median(quantile_list, nonnan_list), index = columns)
+  
+  ## Pass 2: preprocess each admission
+  # Output initialization
+  if ragged:
+    lengths = np.minimum(counts, max_seq_len)
+    processed_data = RaggedData(np.empty([np.sum(lengths), dim], dtype = dtype), lengths)
+  else:
+    processed_data = np.full([no, max_seq_len, dim], -1.0, dtype = dtype)
+  
+  chunked_fill(processed_data, file_name, chunk_size, uniq_id, counts, median_vals, scaler, max_seq_len)
     
-    # MinMax Scaling    
-    curr_data = scaler.transform(curr_data)
+  return processed_data
+
 
-    # Assign to the preprocessed data (Excluding ID)        
-    curr_no = len(curr_data)
-    if curr_no >= max_seq_len:
-      processed_data[i, :, :] = curr_data[:max_seq_len, 1:]
+def chunk_statistics(file_name, chunk_size, n_quantiles, skip_id = None):
+  """Collect the MinMax statistics, admission sizes and quantile summaries in one pass over the CSV.
+  
+  Args:
+    - file_name: CSV file name
+    - chunk_size: the number of rows in each chunk
+    - n_quantiles: the number of quantiles kept per chunk for the medians
+    - skip_id: admission ids to leave out (None to use all rows)
+    
+  Returns:
+    - scaler: MinMax scaler fitted on the rows read
+    - uniq_id: sorted admission ids
+    - counts: the number of rows of each admission
+    - quantile_list: quantiles of each chunk ([n_quantiles, n_columns] for each chunk)
+    - nonnan_list: the number of non-missing values of each chunk ([n_columns] for each chunk)
+  """
+  scaler = MinMaxScaler()
+  id_list, count_list, quantile_list, nonnan_list = list(), list(), list(), list()
+  
+  for chunk in pd.read_csv(file_name, chunksize = chunk_size):
+    if skip_id is not None:
+      chunk = chunk[~chunk['admissionid'].isin(skip_id)]
+      if len(chunk) == 0:
+        continue
+    
+    # MinMax statistics
+    scaler.partial_fit(chunk)
+    
+    # The number of rows of each admission
+    curr_id, curr_counts = np.unique(chunk['admissionid'].values, return_counts = True)
+    id_list.append(curr_id)
+    count_list.append(curr_counts)
+    
+    # Quantile summary for the medians (nearest rank, missing values are sorted last)
+    sorted_values = np.sort(chunk.values.astype(float), axis = 0)
+    nonnan = np.sum(~np.isnan(sorted_values), axis = 0)
+    rank = np.round(np.linspace(0, 1, n_quantiles)[:, None] * np.maximum(nonnan - 1, 0)).astype(int)
+    quantile_list.append(np.take_along_axis(sorted_values, rank, axis = 0))
+    nonnan_list.append(nonnan)
+    
+  if not id_list:
+    return scaler, np.zeros([0,]), np.zeros([0,], dtype = int), quantile_list, nonnan_list
+  
+  uniq_id, inverse = np.unique(np.concatenate(id_list), return_inverse = True)
+  counts = np.bincount(inverse, weights = np.concatenate(count_list)).astype(int)
+  
+  return scaler, uniq_id, counts, quantile_list, nonnan_list
+
+
+def chunked_fill(processed_data, file_name, chunk_size, uniq_id, counts, median_vals, scaler, max_seq_len):
+  """Preprocess each admission as soon as all of its rows are read and assign it to the output.
+  
+  Args:
+    - processed_data: output (front-padded 3d array or RaggedData), in the order of uniq_id
+    - file_name: CSV file name
+    - chunk_size: the number of rows in each chunk
+    - uniq_id: sorted admission ids to preprocess (the rows of other admissions are skipped)
+    - counts: the number of rows of each admission
+    - median_vals: median values for each column
+    - scaler: fitted MinMax scaler
+    - max_seq_len: maximum sequence length
+  """
+  # Rows of the admissions which are not entirely read yet
+  pending_data = None
+  
+  for chunk in pd.read_csv(file_name, chunksize = chunk_size):
+    chunk = chunk[chunk['admissionid'].isin(uniq_id)]
+    if pending_data is not None:
+      chunk = pd.concat([pending_data, chunk])
+      
+    # Admissions whose rows are all read
+    curr_id, curr_counts = np.unique(chunk['admissionid'].values, return_counts = True)
+    done_id = curr_id[curr_counts == counts[np.searchsorted(uniq_id, curr_id)]]
+    done_rows = chunk['admissionid'].isin(done_id).values
+    
+    pending_data = chunk[~done_rows]
+    if not np.any(done_rows):
+      continue
+    
+    # Sort, impute and scale the completed admissions
+    curr_id, curr_counts, scaled_data = admission_preprocess(chunk[done_rows], median_vals, scaler)
+    
+    # Assign to the preprocessed data (Excluding ID)
+    row_idx, data_idx, time_idx = padding_index(curr_counts, max_seq_len)
+    out_idx = np.searchsorted(uniq_id, curr_id)[data_idx]
+    if isinstance(processed_data, RaggedData):
+      step_idx = time_idx - np.maximum(max_seq_len - curr_counts, 0)[data_idx]
+      processed_data.values[processed_data.offsets[out_idx] + step_idx] = scaled_data[row_idx, 1:]
     else:
-      processed_data[i, -curr_no:, :] = (curr_data)[:, 1:]
+      processed_data[out_idx, time_idx, :] = scaled_data[row_idx, 1:]
 
-  return processed_data
+
+def incremental_data_preprocess(file_name, max_seq_len, state_dir, chunk_size = 100000, 
+                                n_quantiles = 1001, dtype = np.float32):
+  """Preprocess only the admissions which are new since the last call and append them.
+  
+  state_dir keeps the preprocessed data, the admission ids and mergeable per-column 
+  statistics (min, max and quantile summaries for the medians, see chunked_data_preprocess).
+  Each call reads the CSV in chunks, skips the admissions which are already preprocessed,
+  merges the statistics of the new rows and preprocesses the new admissions with them.
+  
+  The previously preprocessed data is rescaled only if the global min/max change. It keeps 
+  its imputed values (medians are not re-applied), and new admissions are appended after 
+  it, so the output can differ from a full data_preprocess in imputation and in order. 
+  New rows of already preprocessed admissions are ignored.
+  
+  Args:
+    - file_name: CSV file name (all admissions or only the new ones)
+    - max_seq_len: maximum sequence length
+    - state_dir: directory of the incremental state (created on the first call)
+    - chunk_size: the number of rows in each chunk
+    - n_quantiles: the number of quantiles kept per chunk for the medians
+    - dtype: data type of the preprocessed data
+    
+  Returns:
+    - processed_data: preprocessed data of all admissions
+    - uniq_id: admission id of each row of processed_data
+  """
+  state_file = lambda name: os.path.join(state_dir, name + '.npy')
+  
+  # Load the previous state
+  if os.path.exists(state_file('uniq_id')):
+    processed_data = np.load(state_file('processed_data')).astype(dtype, copy = False)
+    uniq_id = np.load(state_file('uniq_id'))
+    data_min, data_max = np.load(state_file('data_min')), np.load(state_file('data_max'))
+    quantiles, nonnan = np.load(state_file('quantiles')), np.load(state_file('nonnan'))
+    assert processed_data.shape[1] == max_seq_len
+  else:
+    processed_data, uniq_id = None, np.zeros([0,], dtype = np.int64)
+  
+  ## Statistics of the new admissions
+  new_scaler, new_id, new_counts, quantile_list, nonnan_list = \
+    chunk_statistics(file_name, chunk_size, n_quantiles, skip_id = uniq_id)
+    
+  if len(new_id) == 0:
+    return processed_data, uniq_id
+  
+  columns = new_scaler.feature_names_in_
+  dim = len(columns) - 1
+  
+  # Merge the statistics
+  if processed_data is None:
+    old_min, old_max = new_scaler.data_min_, new_scaler.data_max_
+    quantiles, nonnan = np.stack(quantile_list), np.stack(nonnan_list)
+  else:
+    old_min, old_max = data_min, data_max
+    quantiles = np.concatenate([quantiles, np.stack(quantile_list)], axis = 0)
+    nonnan = np.concatenate([nonnan, np.stack(nonnan_list)], axis = 0)
+    
+  data_min, data_max = np.fmin(old_min, new_scaler.data_min_), np.fmax(old_max, new_scaler.data_max_)
+  scaler = MinMaxScaler()
+  scaler.partial_fit(pd.DataFrame([data_min, data_max], columns = columns))
+  median_vals = pd.Series(approximate_median(list(quantiles), list(nonnan)), index = columns)
+  
+  # Rescale the previous data if the global min/max of a feature change (admission id excluded)
+  if processed_data is not None and not (np.array_equal(old_min[1:], data_min[1:], equal_nan = True) and 
+                                         np.array_equal(old_max[1:], data_max[1:], equal_nan = True)):
+    minmax_rescale(processed_data, old_min[1:], old_max[1:], data_min[1:], data_max[1:])
+  
+  ## Preprocess the new admissions
+  new_data = np.full([len(new_id), max_seq_len, dim], -1.0, dtype = dtype)
+  chunked_fill(new_data, file_name, chunk_size, new_id, new_counts, median_vals, scaler, max_seq_len)
+  
+  if processed_data is None:
+    processed_data = new_data
+  else:
+    processed_data = np.concatenate([processed_data, new_data], axis = 0)
+  uniq_id = np.concatenate([uniq_id, new_id])
+  
+  # Save the new state (in a temporary directory first, then swap)
+  os.makedirs(os.path.dirname(os.path.abspath(state_dir)), exist_ok = True)
+  tmp_dir = tempfile.mkdtemp(dir = os.path.dirname(os.path.abspath(state_dir)))
+  for name, value in [('processed_data', processed_data), ('uniq_id', uniq_id), 
+                      ('data_min', data_min), ('data_max', data_max), 
+                      ('quantiles', quantiles), ('nonnan', nonnan)]:
+    np.save(os.path.join(tmp_dir, name + '.npy'), value)
+  if os.path.exists(state_dir):
+    shutil.rmtree(state_dir)
+  os.rename(tmp_dir, state_dir)
+  
+  return processed_data, uniq_id
+
+
+def minmax_rescale(processed_data, old_min, old_max, new_min, new_max):
+  """Rescale front-padded data from old to new MinMax statistics in place (padding is kept).
+  
+  Args:
+    - processed_data: preprocessed data ([no, max_seq_len, dim])
+    - old_min, old_max: MinMax statistics the data was scaled with (for each feature)
+    - new_min, new_max: new MinMax statistics (for each feature)
+  """
+  # Feature range as in MinMaxScaler (a constant feature has range 1)
+  old_range = np.where(old_max - old_min == 0, 1, old_max - old_min)
+  new_range = np.where(new_max - new_min == 0, 1, new_max - new_min)
+  
+  # x = scaled * old_range + old_min, then (x - new_min) / new_range
+  scale = old_range / new_range
+  shift = (old_min - new_min) / new_range
+  
+  # Observed time steps of all admissions at once
+  observed = ~np.all(processed_data == -1, axis = 2)
+  processed_data[observed] = processed_data[observed] * scale + shift
 
 
-def imputation(curr_data, median_vals):
-  """Impute missing data using bfill, ffill and median imputation.
+def approximate_median(quantile_list, nonnan_list):
+  """Merge per-chunk quantile summaries into approximate medians.
   
   Args:
-    - curr_data: current pandas dataframe
+    - quantile_list: quantiles of each chunk ([n_quantiles, n_columns] for each chunk)
+    - nonnan_list: the number of non-missing values of each chunk ([n_columns] for each chunk)
+    
+  Returns:
+    - median_vals: approximate median values for each column
+  """
+  # Each quantile of a chunk stands for the same share of the chunk's values
+  quantiles = np.concatenate(quantile_list, axis = 0)
+  weights = np.concatenate([np.tile(nonnan / len(q), [len(q), 1]) 
+                            for q, nonnan in zip(quantile_list, nonnan_list)], axis = 0)
+  
+  # Output initialization
+  median_vals = np.full([quantiles.shape[1],], np.nan)
+  
+  # Weighted median of each column
+  for j in range(quantiles.shape[1]):
+    valid = weights[:, j] > 0
+    if not np.any(valid):
+      continue
+    order = np.argsort(quantiles[valid, j])
+    cum_weights = np.cumsum(weights[valid, j][order])
+    median_vals[j] = quantiles[valid, j][order][np.searchsorted(cum_weights, cum_weights[-1] / 2)]
+    
+  return median_vals
+
+
+def admission_preprocess(ori_data, median_vals, scaler):
+  """Sort the rows by admission, then preprocess time, impute and scale.
+  
+  Args:
+    - ori_data: pandas dataframe of complete admissions
+    - median_vals: median values for each column
+    - scaler: fitted MinMax scaler
+    
+  Returns:
+    - uniq_id: sorted admission ids
+    - counts: the number of rows of each admission
+    - scaled_data: imputed and scaled data (including ID) grouped by admission
+  """
+  # Sort once by admissionid (stable, so the row order within each admission is kept)
+  sort_idx = np.argsort(ori_data['admissionid'].values, kind = 'mergesort')
+  ori_data = ori_data.iloc[sort_idx].reset_index(drop = True)
+
+  # Group offsets of each uniq id in the sorted data
+  uniq_id, start_idx, counts = np.unique(ori_data['admissionid'].values, 
+                                         return_index = True, return_counts = True)
+
+  # Preprocess time (minimum time of each uniq id, ignoring missing values)
+  min_time = np.fmin.reduceat(ori_data['time'].values, start_idx)
+  ori_data['time'] = ori_data['time'].values - np.repeat(min_time, counts)
+
+  # Impute missing data
+  ori_data = imputation(ori_data, median_vals)
+    
+  # MinMax Scaling
+  scaled_data = scaler.transform(ori_data)
+  
+  return uniq_id, counts, scaled_data
+
+
+def padding_index(counts, max_seq_len):
+  """Map the rows of the grouped data to their front-padded positions.
+  
+  Args:
+    - counts: the number of rows of each group (in the order of the rows)
+    - max_seq_len: maximum sequence length
+    
+  Returns:
+    - row_idx: rows kept (the first max_seq_len rows of each group)
+    - data_idx: group index of each kept row
+    - time_idx: time index of each kept row in the front-padded sequence
+  """
+  # Cumulative count of each row in its group
+  group_no = np.repeat(np.arange(len(counts)), counts)
+  start_idx = np.cumsum(counts) - counts
+  cum_count = np.arange(np.sum(counts)) - start_idx[group_no]
+  
+  # Truncate long sequences and front-pad short sequences
+  row_idx = np.where(cum_count < max_seq_len)[0]
+  data_idx = group_no[row_idx]
+  time_idx = cum_count[row_idx] + np.maximum(max_seq_len - counts, 0)[data_idx]
+  
+  return row_idx, data_idx, time_idx
+
+
+def imputation(ori_data, median_vals):
+  """Impute missing data using bfill, ffill (within each admission) and median imputation.
+  
+  Args:
+    - ori_data: pandas dataframe of all admissions
     - median_vals: median values for each column
     
   Returns:
@@ -88,10 +521,14 @@ def imputation(curr_data, median_vals):
   """
   
   # Backward fill
-  imputed_data = curr_data.bfill(axis = 'rows')
+  imputed_data = ori_data.groupby('admissionid', sort = False).bfill()
   # Forward fill  
-  imputed_data = imputed_data.ffill(axis = 'rows')
+  imputed_data = imputed_data.groupby(ori_data['admissionid'], sort = False).ffill()
   # Median fill
   imputed_data = imputed_data.fillna(median_vals)
+  
+  # Restore admissionid and the column order
+  imputed_data['admissionid'] = ori_data['admissionid']
+  imputed_data = imputed_data[ori_data.columns]
 
   return imputed_data
@@ -15,13 +15,14 @@ Contact: jsyoon0823@gmail.com
 data_utils.py
 
 (1) MinMaxScaler: Min Max normalizer
-(2) data_division: Divide the dataset into sub datasets.
-(3) subset_sampling: Sample the original data to construct multiple sub data
+(2) split_index: Randomly split the sample indices by the division rates
+(3) data_division: Divide the dataset into sub datasets.
+(4) subset_sampling: Sample the original data to construct multiple sub data
 """
 
 ## Necessary Packages
 import numpy as np
-import random
+from data.ragged import RaggedData
 
 
 def MinMaxScaler(data):
@@ -39,37 +40,46 @@ def MinMaxScaler(data):
   return norm_data
 
 
-def data_division (data, seed, divide_rates):
-  """Divide the dataset into sub datasets.
+def split_index (no, seed, divide_rates):
+  """Randomly split the sample indices by the division rates.
   
   Args:
-    - data: original data (list format)
+    - no: the number of samples
     - seed: random seed
     - divide_rates: ratio for each division
     
   Returns:
-    - divided_data: divided data (list format)
-    - divided_index: divided data index (list format)
+    - divided_index: divided data index (list of index arrays)
   """
   # sum of the division rates should be 1
   assert sum(divide_rates) == 1
   
-  # Output initialization
-  divided_data = list()
-  divided_index = list()
+  index = np.random.RandomState(seed).permutation(no)
+  bounds = [int(no*sum(divide_rates[:i])) for i in range(len(divide_rates)+1)]
   
-  # Set index
-  no = len(data)
-  random.seed(seed)
-  index = np.random.permutation(no)
+  return [index[bounds[i]:bounds[i+1]] for i in range(len(divide_rates))]
 
-  # Set divided index & data
-  for i in range(len(divide_rates)):
-    temp_idx = index[int(no*sum(divide_rates[:i])):int(no*sum(divide_rates[:(i+1)]))]
-    divided_index.append(temp_idx)
+
+def data_division (data, seed, divide_rates):
+  """Divide the dataset into sub datasets.
+  
+  Each division is gathered with a single fancy index (a memory-mapped array 
+  only reads the selected rows), so no per-sample lists are built.
+  
+  Args:
+    - data: original data (array, memory-mapped array, RaggedData or list format)
+    - seed: random seed
+    - divide_rates: ratio for each division
     
-    temp_data = [data[j] for j in temp_idx]
-    divided_data.append(temp_data)
+  Returns:
+    - divided_data: divided data (arrays, or RaggedData for RaggedData input)
+    - divided_index: divided data index (list of index arrays)
+  """
+  if not isinstance(data, (np.ndarray, RaggedData)):
+    data = np.asarray(data)
+  
+  divided_index = split_index(len(data), seed, divide_rates)
+  divided_data = [data[idx] for idx in divided_index]
   
   return divided_data, divided_index
 
@@ -77,30 +87,26 @@ def data_division (data, seed, divide_rates):
 def subset_sampling (data, seed, subset_rates):
   """Sample the original data to construct multiple sub data.
   
+  The permutations of all subsets are drawn at once as an index matrix, 
+  and each subset takes the first no*subset_rates[i] indices of its row.
+  
   Args:
-    - data: original data (list format)
+    - data: original data (array, memory-mapped array, RaggedData or list format)
     - seed: random seed
     - subset_rates: ratio for each division
     
   Returns:
-    - divided_data: divided data (list format)
-    - divided_index: divided data index (list format)
+    - divided_data: divided data (arrays, or RaggedData for RaggedData input)
+    - divided_index: divided data index (rows of the index matrix)
   """
-  # Output initialization
-  divided_data = list()
-  divided_index = list()
+  if not isinstance(data, (np.ndarray, RaggedData)):
+    data = np.asarray(data)
   
-  # Set index
+  # Index matrix: one random permutation per subset ([len(subset_rates), no])
   no = len(data)
-
-  # Set divided index & data
-  for i in range(len(subset_rates)):
-    random.seed(seed+i)
-    
-    index = np.random.permutation(no)[int(no*subset_rates[i])]
-    divided_index.append(index)
-    
-    temp_data = [data[j] for j in index]
-    divided_data.append(temp_data)
+  index = np.argsort(np.random.RandomState(seed).rand(len(subset_rates), no), axis = 1)
   
-  return divided_data, divided_index  
\ No newline at end of file
+  divided_index = [index[i, :int(no*subset_rates[i])] for i in range(len(subset_rates))]
+  divided_data = [data[idx] for idx in divided_index]
+  
+  return divided_data, divided_index
@@ -0,0 +1,123 @@
+"""Hide-and-Seek Privacy Challenge Codebase.
+
+Reference: James Jordon, Daniel Jarrett, Jinsung Yoon, Ari Ercole, Cheng Zhang, Danielle Belgrave, Mihaela van der Schaar,
+"Hide-and-Seek Privacy Challenge: Synthetic Data Generation vs. Patient Re-identification with Clinical Time-series Data,"
+Neural Information Processing Systems (NeurIPS) Competition, 2020.
+
+Link: https://www.vanderschaar-lab.com/announcing-the-neurips-2020-hide-and-seek-privacy-challenge/
+
+Last updated Date: June 21th 2020
+Code author: Jinsung Yoon
+Contact: jsyoon0823@gmail.com
+
+-----------------------------
+
+data_view.py
+
+(1) DataView: concatenated and permuted datasets as an index over the original arrays
+(2) save_npy: Save an array or a DataView as a .npy file, batch by batch
+"""
+
+## Necessary Packages
+import numpy as np
+
+
+class DataView():
+  """Concatenated and permuted datasets as an index over the original arrays.
+
+  Nothing is copied when the view is built, concatenated or permuted. Indexing
+  with an integer, a slice or an index array materializes only the selected rows
+  (e.g. one mini-batch), and np.asarray materializes the whole view.
+
+  Attributes:
+    - datasets: original arrays (3d arrays or memory-mapped arrays with the same row shape)
+    - offsets: first row of each dataset in the concatenation
+    - index: row of the concatenation for each row of the view
+  """
+
+  def __init__(self, datasets, index = None):
+
+    self.datasets = list(datasets)
+    sizes = np.asarray([len(data) for data in self.datasets], dtype = np.int64)
+    self.offsets = np.cumsum(sizes) - sizes
+    self.index = np.arange(np.sum(sizes)) if index is None else np.asarray(index, dtype = np.int64)
+
+    assert all([data.shape[1:] == self.datasets[0].shape[1:] for data in self.datasets])
+
+
+  def __len__(self):
+    return len(self.index)
+
+
+  @property
+  def shape(self):
+    return (len(self),) + tuple(self.datasets[0].shape[1:])
+
+
+  @property
+  def ndim(self):
+    return len(self.shape)
+
+
+  @property
+  def dtype(self):
+    return np.result_type(*[data.dtype for data in self.datasets])
+
+
+  @property
+  def nbytes(self):
+    return int(np.prod(self.shape)) * self.dtype.itemsize
+
+
+  def subset(self, idx):
+    """Return a view of the selected rows (in the order of idx), without copying."""
+    return DataView(self.datasets, self.index[idx])
+
+
+  def __getitem__(self, idx):
+    """Materialize the selected rows (the first index selects rows, the others apply to each row)."""
+    if isinstance(idx, tuple):
+      rows = self[idx[0]]
+      if np.ndim(idx[0]) == 0 and not isinstance(idx[0], slice):
+        return rows[idx[1:]]
+      return rows[(slice(None),) + idx[1:]]
+
+    rows = self.index[idx]
+    if np.ndim(rows) == 0:
+      source = np.searchsorted(self.offsets, rows, side = 'right') - 1
+      return np.asarray(self.datasets[source][rows - self.offsets[source]])
+
+    # Gather from each dataset with a single fancy index
+    source = np.searchsorted(self.offsets, rows, side = 'right') - 1
+    selected_data = np.empty((len(rows),) + self.shape[1:], dtype = self.dtype)
+    for s, data in enumerate(self.datasets):
+      mask = source == s
+      if np.any(mask):
+        selected_data[mask] = data[rows[mask] - self.offsets[s]]
+    return selected_data
+
+
+  def __array__(self, dtype = None):
+    data = self[:]
+    return data if dtype is None else data.astype(dtype)
+
+
+def save_npy (file_name, data, batch_size = 1024):
+  """Save an array or a DataView as a .npy file, batch by batch.
+
+  A DataView is written through a memory-mapped output, so it is never
+  materialized as a whole.
+
+  Args:
+    - file_name: .npy file name
+    - data: array or DataView
+    - batch_size: the number of rows written at a time
+  """
+  if not isinstance(data, DataView):
+    np.save(file_name, np.asarray(data))
+    return
+
+  saved_data = np.lib.format.open_memmap(file_name, mode = 'w+', dtype = data.dtype, shape = data.shape)
+  for i in range(0, len(data), batch_size):
+    saved_data[i:(i + batch_size)] = data[i:(i + batch_size)]
+  saved_data.flush()
@@ -0,0 +1,178 @@
+"""Hide-and-Seek Privacy Challenge Codebase.
+
+Reference: James Jordon, Daniel Jarrett, Jinsung Yoon, Ari Ercole, Cheng Zhang, Danielle Belgrave, Mihaela van der Schaar,
+"Hide-and-Seek Privacy Challenge: Synthetic Data Generation vs. Patient Re-identification with Clinical Time-series Data,"
+Neural Information Processing Systems (NeurIPS) Competition, 2020.
+
+Link: https://www.vanderschaar-lab.com/announcing-the-neurips-2020-hide-and-seek-privacy-challenge/
+
+Last updated Date: June 21th 2020
+Code author: Jinsung Yoon
+Contact: jsyoon0823@gmail.com
+
+-----------------------------
+
+ragged.py
+
+(1) RaggedData: variable-length time-series stored as a flat values array with offsets
+(2) sequence_lengths: Return the length of each front-padded sequence
+(3) to_padded: Pad ragged data to a common length (dense data is returned as is)
+"""
+
+## Necessary Packages
+import numpy as np
+
+
+class RaggedData():
+  """Variable-length time-series stored as a flat values array with offsets.
+
+  Memory scales with the number of observed time steps instead of no * max_seq_len.
+
+  Attributes:
+    - values: observed time steps of all sequences ([sum(lengths), dim])
+    - offsets: first row of each sequence in values
+    - lengths: length of each sequence
+  """
+
+  def __init__(self, values, lengths):
+
+    self.values = values
+    self.lengths = np.asarray(lengths, dtype = np.int64)
+    self.offsets = np.cumsum(self.lengths) - self.lengths
+
+    assert len(values) == np.sum(self.lengths)
+
+
+  @classmethod
+  def from_padded(cls, data, pad_value = -1):
+    """Convert front-padded 3d data to ragged data.
+
+    Args:
+      - data: front-padded time-series data ([no, max_seq_len, dim])
+      - pad_value: value of the padded time steps
+
+    Returns:
+      - ragged_data: ragged data
+    """
+    no, seq_len, dim = data.shape
+    lengths = sequence_lengths(data, pad_value)
+    # Observed time steps are the last lengths[i] steps of each sequence
+    observed = np.arange(seq_len)[None, :] >= (seq_len - lengths)[:, None]
+    return cls(np.asarray(data)[observed], lengths)
+
+
+  def __len__(self):
+    return len(self.lengths)
+
+
+  @property
+  def dim(self):
+    return self.values.shape[1]
+
+
+  @property
+  def dtype(self):
+    return self.values.dtype
+
+
+  @property
+  def max_seq_len(self):
+    return int(np.max(self.lengths)) if len(self.lengths) else 0
+
+
+  def __getitem__(self, idx):
+    """Return a sequence ([length, dim]) for an integer index, or the selected sequences as ragged data."""
+    if np.ndim(idx) == 0 and not isinstance(idx, slice):
+      return self.values[self.offsets[idx]:(self.offsets[idx] + self.lengths[idx])]
+
+    idx = np.arange(len(self))[idx]
+    lengths = self.lengths[idx]
+    return RaggedData(self.values[self._row_index(idx)], lengths)
+
+
+  def with_values(self, values):
+    """Return ragged data with the same sequence lengths and new values."""
+    assert len(values) == len(self.values)
+    return RaggedData(values, self.lengths)
+
+
+  def pad(self, idx = None, max_seq_len = None, pad_value = -1):
+    """Front-pad the selected sequences to 3d data.
+
+    Args:
+      - idx: selected sequences (all sequences if None)
+      - max_seq_len: padded length (the longest selected sequence if None)
+      - pad_value: value of the padded time steps
+
+    Returns:
+      - padded_data: front-padded time-series data ([len(idx), max_seq_len, dim])
+    """
+    idx = np.arange(len(self)) if idx is None else np.arange(len(self))[idx]
+    lengths = self.lengths[idx]
+    if max_seq_len is None:
+      max_seq_len = int(np.max(lengths)) if len(lengths) else 0
+    assert np.all(lengths <= max_seq_len)
+
+    # Position of each observed time step in the padded data
+    data_idx = np.repeat(np.arange(len(idx)), lengths)
+    time_idx = np.arange(np.sum(lengths)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    time_idx = time_idx + (max_seq_len - lengths)[data_idx]
+
+    padded_data = np.full([len(idx), max_seq_len, self.dim], pad_value, dtype = self.dtype)
+    padded_data[data_idx, time_idx, :] = self.values[self._row_index(idx)]
+
+    return padded_data
+
+
+  def _row_index(self, idx):
+    """Rows of values of the selected sequences (in order)."""
+    lengths = self.lengths[idx]
+    new_offsets = np.cumsum(lengths) - lengths
+    return np.arange(np.sum(lengths)) + np.repeat(self.offsets[idx] - new_offsets, lengths)
+
+
+def sequence_lengths(data, pad_value = -1):
+  """Return the length of each front-padded sequence.
+
+  A time step is padded if all of its features equal pad_value.
+
+  Args:
+    - data: front-padded time-series data ([no, max_seq_len, dim])
+    - pad_value: value of the padded time steps
+
+  Returns:
+    - lengths: the number of time steps after the padding in each sequence
+  """
+  no, seq_len, dim = data.shape
+  padded = np.all(np.asarray(data) == pad_value, axis = 2)
+  # Padding is the leading run of padded time steps
+  pad_no = np.where(np.all(padded, axis = 1), seq_len, np.argmin(padded, axis = 1))
+  return seq_len - pad_no
+
+
+def to_padded(*datasets):
+  """Pad ragged data to a common length (dense data is returned as is).
+
+  Args:
+    - datasets: ragged or front-padded time-series data
+
+  Returns:
+    - padded_datasets: front-padded time-series data (list format)
+  """
+  ragged = [data for data in datasets if isinstance(data, RaggedData)]
+  if not ragged:
+    return list(datasets)
+
+  # Longest sequence of all datasets
+  max_seq_len = max([data.max_seq_len if isinstance(data, RaggedData) else data.shape[1]
+                     for data in datasets])
+
+  padded_datasets = list()
+  for data in datasets:
+    if isinstance(data, RaggedData):
+      data = data.pad(max_seq_len = max_seq_len)
+    else:
+      assert data.shape[1] == max_seq_len, 'Dense data must be at least as long as the ragged sequences'
+    padded_datasets.append(data)
+
+  return padded_datasets
@@ -25,23 +25,31 @@ def add_noise(ori_data, noise_size):
   """Add Gaussian noise on the original data and use as the synthetic data.
   
   Args:
-    - ori_data: original time-series data
+    - ori_data: original time-series data (3d array or RaggedData)
     - noise_size: amplitude of the added noise
     
   Returns:
     - generated_data: generated synthetic data
   """
-  # Parameters
-  no, seq_len, dim = ori_data.shape
+  # Ragged data (see data/ragged.py) keeps only the observed time steps in 2d
+  ragged = hasattr(ori_data, 'with_values')
   
-  prep_data = np.reshape(ori_data.copy(), [no * seq_len, dim])
+  # Parameters
+  if ragged:
+    prep_data = ori_data.values.copy()
+  else:
+    no, seq_len, dim = ori_data.shape
+    prep_data = np.reshape(ori_data.copy(), [no * seq_len, dim])
   
   # Add noise
-  for i in range(dim):
+  for i in range(prep_data.shape[1]):
     noise_amplitude = np.std(prep_data[:, i]) * noise_size
-    noise_vector = np.random.normal(0, noise_amplitude, size = [no * seq_len,])
+    noise_vector = np.random.normal(0, noise_amplitude, size = [len(prep_data),])
     prep_data[:, i] = prep_data[:, i] + noise_vector                      
     
+  if ragged:
+    return ori_data.with_values(prep_data)
+  
   generated_data = np.reshape(prep_data, [no, seq_len, dim])
   
   return generated_data
\ No newline at end of file
@@ -41,7 +41,8 @@ from hider.add_noise import add_noise
 from seeker.knn.knn_seeker import knn_seeker
 from seeker.binary_predictor.binary_predictor import binary_predictor
 from data.data_utils import data_division
-from data.data_preprocess import data_preprocess
+from data.data_cache import cached_data_division
+from data.data_view import DataView
 from metrics.metric_utils import feature_prediction, one_step_ahead_prediction, reidentify_score
 
 
@@ -51,6 +52,10 @@ def main(args):
   Args:
     - data_name: amsterdam or stock
     - max_seq_len: maximum sequence length
+    - chunk_size: the number of CSV rows read at a time (None to read the whole file)
+    - workers: the number of preprocessing processes
+    - cache_dir: directory of the preprocessed data cache (None to disable the cache)
+    - dtype: data type of the data (float32 or float64)
     - train_rate: ratio of training data
     - feature_prediction_no: the number of features to be predicted for evaluation
     - seed: random seed for train / test data division
@@ -63,20 +68,20 @@ def main(args):
     - reidentification_score: reidentification score between hider and seeker
   """
   
-  ## Load & preprocess data
+  ## Load & preprocess data, then divide the data into training and testing
   if args.data_name == 'amsterdam':   
     file_name = 'data/amsterdam/train_longitudinal_data.csv'
-    ori_data = data_preprocess(file_name, args.max_seq_len)
+    divided_data, _ = cached_data_division(file_name, args.max_seq_len, seed = args.seed, 
+                                           divide_rates = [args.train_rate, 1-args.train_rate], 
+                                           cache_dir = args.cache_dir, chunk_size = args.chunk_size, 
+                                           dtype = args.dtype, workers = args.workers)
   elif args.data_name == 'stock':
     with open('data/public_data/public_' + args.data_name + '_data.txt', 'rb') as fp:
       ori_data = pickle.load(fp)
-      ori_data = np.asarray(ori_data)
-    
-  # Divide the data into training and testing
-  divided_data, _ = data_division(ori_data, seed = args.seed, divide_rates = [args.train_rate, 1-args.train_rate])
+      ori_data = np.asarray(ori_data, dtype = args.dtype)
+    divided_data, _ = data_division(ori_data, seed = args.seed, divide_rates = [args.train_rate, 1-args.train_rate])
   
-  train_data = np.asarray(divided_data[0])
-  test_data = np.asarray(divided_data[1])
+  train_data, test_data = divided_data
 
   print('Finish data loading: ' + str(args.data_name))  
   
@@ -88,18 +93,20 @@ def main(args):
     
   print('Finish hider algorithm (' + args.hider_model  + ') training')  
   
-  ## Define enlarge data and its labels
-  enlarge_data = np.concatenate((train_data, test_data), axis = 0)
+  ## Define enlarge data and its labels (a view over train and test data, without copies)
+  enlarge_data = DataView([train_data, test_data])
   enlarge_data_label = np.concatenate((np.ones([train_data.shape[0],]), np.zeros([test_data.shape[0],])), axis = 0)
   
   # Mix the order
   idx = np.random.permutation(enlarge_data.shape[0])
-  enlarge_data = enlarge_data[idx]
+  enlarge_data = enlarge_data.subset(idx)
   enlarge_data_label = enlarge_data_label[idx]
   
   ## Run seeker algorithm
   if args.seeker_model == 'binary_predictor':
     reidentified_data = binary_predictor(generated_data, enlarge_data)  
+  elif args.seeker_model == 'binary_predictor_gbt':
+    reidentified_data = binary_predictor(generated_data, enlarge_data, model_type = 'gbt')
   elif args.seeker_model == 'knn':
     reidentified_data = knn_seeker(generated_data, enlarge_data)
   
@@ -149,6 +156,23 @@ if __name__ == '__main__':
       '--max_seq_len',
       default=100,
       type=int)
+  parser.add_argument(
+      '--chunk_size',
+      default=None,
+      type=int)
+  parser.add_argument(
+      '--workers',
+      default=1,
+      type=int)
+  parser.add_argument(
+      '--cache_dir',
+      default='data/cache',
+      type=str)
+  parser.add_argument(
+      '--dtype',
+      choices=['float32','float64'],
+      default='float32',
+      type=str)
   parser.add_argument(
       '--train_rate',
       default=0.8,
@@ -172,7 +196,7 @@ if __name__ == '__main__':
       type=float)
   parser.add_argument(
       '--seeker_model',
-      choices=['binary_predictor','knn'],
+      choices=['binary_predictor','binary_predictor_gbt','knn'],
       default='binary_predictor',
       type=str)
   
@@ -8,17 +8,17 @@ Contact: jsyoon0823@gmail.com
 (1) binary_cross_entropy_loss: binary cross entropy loss (excluding padded data)
 (2) mse_loss: mse loss (excluding padded data)
 (3) rnn_sequential: rnn module for GeneralRNN class
-(4) GeneralRNN: class of general RNN modules
+(4) sequence_lengths: Return the length of each front-padded sequence
+(5) length_batches: Group the selected samples into batches of similar sequence length
+(6) batch_dataset: tf.data pipeline of length-bucketed mini-batches gathered on the fly
+(7) BestWeights: in-memory best weights snapshot with patience-based early stopping
+(8) GeneralRNN: class of general RNN modules
 """
 
 # Necessary packages
-import os
 import tensorflow as tf
 import numpy as np
-import tempfile
-from datetime import datetime
 from tensorflow.keras import layers
-from keras.callbacks import ModelCheckpoint
 
 
 def binary_cross_entropy_loss (y_true, y_pred):
@@ -87,6 +87,144 @@ def rnn_sequential (model, model_name, h_dim, return_seq, name = None):
   return model
 
 
+def sequence_lengths (x, block_size = 1024):
+  """Return the length of each front-padded sequence (read in blocks).
+  
+  Args:
+    - x: front-padded features (array, memory-mapped array or DataView)
+    - block_size: the number of sequences read at a time
+    
+  Returns:
+    - lengths: the number of time steps after the -1 padding in each sequence
+  """
+  no, seq_len = len(x), x.shape[1]
+  lengths = np.zeros([no,], dtype = np.int64)
+  for i in range(0, no, block_size):
+    padded = np.all(np.asarray(x[i:(i + block_size)]) == -1, axis = 2)
+    # Padding is the leading run of padded time steps
+    pad_no = np.where(np.all(padded, axis = 1), seq_len, np.argmin(padded, axis = 1))
+    lengths[i:(i + block_size)] = seq_len - pad_no
+  return lengths
+
+
+def length_batches (lengths, idx, batch_size, shuffle = False):
+  """Group the selected samples into batches of similar sequence length.
+  
+  Args:
+    - lengths: sequence length of each sample
+    - idx: selected samples
+    - batch_size: the number of samples in each batch
+    - shuffle: random order within each length and random batch order (for training)
+    
+  Returns:
+    - batches: sample index of each batch (list format)
+  """
+  idx = np.asarray(idx, dtype = np.int64)
+  order = np.random.permutation(len(idx)) if shuffle else np.arange(len(idx))
+  order = order[np.argsort(lengths[idx[order]], kind = 'stable')]
+  batches = [idx[order[i:(i + batch_size)]] for i in range(0, len(idx), batch_size)]
+  if shuffle:
+    batches = [batches[i] for i in np.random.permutation(len(batches))]
+  return batches
+
+
+def batch_dataset (x, y, idx, batch_size, lengths, shuffle = False):
+  """tf.data pipeline of length-bucketed mini-batches gathered on the fly.
+  
+  The samples are grouped into batches of similar sequence length (see length_batches, 
+  regrouped every epoch if shuffle), and each batch is trimmed to its longest sequence, 
+  so the RNN skips the padding steps. The samples of each batch are gathered with one 
+  fancy index in file order (so memory-mapped sources are read sequentially), cast to 
+  float32 and prefetched while the model trains.
+  
+  Args:
+    - x: front-padded features (array, memory-mapped array or DataView)
+    - y: labels (None for prediction)
+    - idx: selected samples
+    - batch_size: the number of samples in each batch
+    - lengths: sequence length of each sample (see sequence_lengths)
+    - shuffle: shuffle the samples (for training)
+    
+  Returns:
+    - dataset: tf.data dataset of (x, y) batches, or x batches if y is None
+  """
+  seq_len = x.shape[1]
+  
+  def index_batches():
+    for batch_idx in length_batches(lengths, idx, batch_size, shuffle):
+      yield np.sort(batch_idx)
+  
+  def gather(batch_idx):
+    # Trim the leading padding steps shared by the whole batch
+    start = seq_len - max(int(np.max(lengths[batch_idx])), 1)
+    batch_x = np.asarray(x[batch_idx], dtype = np.float32)
+    if y is None:
+      return batch_x[:, start:]
+    batch_y = np.asarray(y[batch_idx], dtype = np.float32)
+    if batch_y.ndim == 3:
+      # Keep the steps with observed labels (e.g. one-step ahead labels start one step before x)
+      start = min(start, seq_len - max(int(np.max(sequence_lengths(batch_y, len(batch_y)))), 1))
+      batch_y = batch_y[:, start:]
+    return batch_x[:, start:], batch_y
+  
+  dataset = tf.data.Dataset.from_generator(index_batches, output_signature = tf.TensorSpec([None], tf.int64))
+  
+  x_shape = [None, None] + list(x.shape[2:])
+  if y is None:
+    def gather_fn(batch_idx):
+      batch_x = tf.numpy_function(gather, [batch_idx], tf.float32)
+      batch_x.set_shape(x_shape)
+      return batch_x
+  else:
+    y_shape = [None, None] + list(y.shape[2:]) if len(y.shape) == 3 else [None] + list(y.shape[1:])
+    def gather_fn(batch_idx):
+      batch_x, batch_y = tf.numpy_function(gather, [batch_idx], [tf.float32, tf.float32])
+      batch_x.set_shape(x_shape)
+      batch_y.set_shape(y_shape)
+      return batch_x, batch_y
+  
+  return dataset.map(gather_fn, num_parallel_calls = tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+
+
+class BestWeights(tf.keras.callbacks.Callback):
+  """In-memory best weights snapshot with patience-based early stopping.
+  
+  The weights with the lowest validation loss are kept in memory and restored at 
+  the end of training, whether it stopped early or not.
+  
+  Attributes:
+    - patience: the number of epochs without improvement before stopping
+  """
+  
+  def __init__(self, patience = 5):
+    
+    super(BestWeights, self).__init__()
+    self.patience = patience
+    
+    
+  def on_train_begin(self, logs = None):
+    self.best_loss = np.inf
+    self.best_weights = None
+    self.wait = 0
+    
+    
+  def on_epoch_end(self, epoch, logs = None):
+    loss = (logs or {}).get('val_loss', np.inf)
+    if loss < self.best_loss:
+      self.best_loss = loss
+      self.best_weights = self.model.get_weights()
+      self.wait = 0
+    else:
+      self.wait += 1
+      if self.wait >= self.patience:
+        self.model.stop_training = True
+        
+        
+  def on_train_end(self, logs = None):
+    if self.best_weights is not None:
+      self.model.set_weights(self.best_weights)
+
+
 class GeneralRNN():
   """RNN predictive model to time-series.
   
@@ -99,6 +237,9 @@ class GeneralRNN():
       - batch_size: the number of samples in each batch
       - epoch: the number of iteration epochs
       - learning_rate: the learning rate of model training
+      - patience: epochs without validation improvement before early stopping (optional, 5 by default)
+      - predict_batch_size: the number of samples in each inference batch (optional, 1024 by default)
+      - predict_chunk_size: the number of samples read at a time in predict (optional, 16384 by default)
   """
 
   def __init__(self, model_parameters):
@@ -110,11 +251,15 @@ class GeneralRNN():
     self.batch_size = model_parameters['batch_size']
     self.epoch = model_parameters['epoch']
     self.learning_rate = model_parameters['learning_rate']
+    self.patience = model_parameters.get('patience', 5)
+    self.predict_batch_size = model_parameters.get('predict_batch_size', 1024)
+    self.predict_chunk_size = model_parameters.get('predict_chunk_size', 16384)
     
     assert self.model_type in ['rnn', 'lstm', 'gru']
 
     # Predictor model define
     self.predictor_model = None
+    self.forward_fn = None
   
   
   def _build_model(self, x, y):
@@ -129,10 +274,10 @@ class GeneralRNN():
     """    
     # Parameters
     dim = len(x[0, 0, :])
-    max_seq_len = len(x[0, :, 0])
 
+    # Any sequence length, so that each batch can be trimmed to its longest sequence
     model = tf.keras.Sequential()
-    model.add(layers.Masking(mask_value=-1., input_shape=(max_seq_len, dim)))
+    model.add(layers.Masking(mask_value=-1., input_shape=(None, dim)))
 
     # Stack multiple layers
     for _ in range(self.n_layer - 1):
@@ -162,7 +307,7 @@ class GeneralRNN():
     """Fit the predictor model.
     
     Args:
-      - x: training features
+      - x: training features (array, memory-mapped array or DataView)
       - y: training labels
       
     Returns:
@@ -172,38 +317,81 @@ class GeneralRNN():
     train_idx = idx[:int(len(idx)*(1-valid_rate))]
     valid_idx = idx[int(len(idx)*(1-valid_rate)):]
     
-    train_x, train_y = x[train_idx], y[train_idx]
-    valid_x, valid_y = x[valid_idx], y[valid_idx]
+    self.predictor_model = self._build_model(x, y)
+    self.forward_fn = None
     
-    self.predictor_model = self._build_model(train_x, train_y)
-
-    with tempfile.TemporaryDirectory() as tmpdir:
-      save_file_name = os.path.join(tmpdir, 'model.ckpt')
+    # Length-bucketed batches are gathered by index on the fly (no train / valid copies)
+    lengths = sequence_lengths(x)
+    train_data = batch_dataset(x, y, train_idx, self.batch_size, lengths, shuffle = True)
+    valid_data = batch_dataset(x, y, valid_idx, self.batch_size, lengths)
 
-      # Callback for the best model saving
-      save_best = ModelCheckpoint(save_file_name, monitor='val_loss',
-                                  mode='min', verbose=False,
-                                  save_best_only=True)
+    # Callback for the best weights (in memory) and early stopping
+    best_weights = BestWeights(self.patience)
 
-      # Train the model
-      self.predictor_model.fit(train_x, train_y, 
-                               batch_size=self.batch_size, epochs=self.epoch, 
-                               validation_data=(valid_x, valid_y), 
-                               callbacks=[save_best], verbose=False)
-
-      self.predictor_model.load_weights(save_file_name)
+    # Train the model
+    self.predictor_model.fit(train_data, epochs=self.epoch, 
+                             validation_data=valid_data, 
+                             callbacks=[best_weights], verbose=False)
 
     return self.predictor_model
   
   
-  def predict(self, test_x):
-    """Return the temporal and feature importance.
+  def _forward(self, dim):
+    """Compiled forward pass with a fixed input signature (any batch size and length).
+    
+    Args:
+      - dim: feature dimensions
+      
+    Returns:
+      - forward: tf.function of the predictor model in inference mode
+    """
+    if self.forward_fn is None:
+      model = self.predictor_model
+      self.forward_fn = tf.function(lambda batch_x: model(batch_x, training = False), 
+                                    input_signature = [tf.TensorSpec([None, None, dim], tf.float32)])
+    return self.forward_fn
+  
+  
+  def predict(self, test_x, batch_size = None, chunk_size = None):
+    """Return the predictions of the trained model.
+    
+    The testing set is read in chunks of consecutive rows (so a memory-mapped input 
+    is streamed sequentially), each chunk is split into length-bucketed batches trimmed 
+    to their longest sequence, and each batch runs through one compiled forward pass.
     
     Args:
-      - test_x: testing features
+      - test_x: testing features (array, memory-mapped array or DataView)
+      - batch_size: the number of samples in each inference batch (predict_batch_size by default)
+      - chunk_size: the number of samples read at a time (predict_chunk_size by default)
       
     Returns:
       - test_y_hat: predictions on testing set
     """
-    test_y_hat = self.predictor_model.predict(test_x)
+    batch_size = self.predict_batch_size if batch_size is None else batch_size
+    chunk_size = self.predict_chunk_size if chunk_size is None else chunk_size
+    no, seq_len, dim = len(test_x), test_x.shape[1], test_x.shape[2]
+    forward = self._forward(dim)
+    
+    # Output of the masked padding steps (all padded input)
+    pad_y_hat = forward(-np.ones([1, 1, dim], dtype = np.float32)).numpy()
+    if pad_y_hat.ndim == 3:
+      test_y_hat = np.tile(pad_y_hat, [no, seq_len, 1])
+    else:
+      test_y_hat = np.zeros([no, pad_y_hat.shape[-1]], dtype = pad_y_hat.dtype)
+    
+    for i in range(0, no, chunk_size):
+      chunk_x = np.asarray(test_x[i:(i + chunk_size)], dtype = np.float32)
+      lengths = sequence_lengths(chunk_x, block_size = len(chunk_x))
+      
+      for batch_idx in length_batches(lengths, np.arange(len(chunk_x)), batch_size):
+        # Trim the leading padding steps shared by the whole batch
+        start = seq_len - max(int(np.max(lengths[batch_idx])), 1)
+        batch_y_hat = forward(chunk_x[batch_idx, start:]).numpy()
+        
+        # Front-pad the trimmed sequences back to seq_len
+        if batch_y_hat.ndim == 3:
+          test_y_hat[i + batch_idx, start:] = batch_y_hat
+        else:
+          test_y_hat[i + batch_idx] = batch_y_hat
+        
     return test_y_hat
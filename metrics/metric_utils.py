@@ -22,6 +22,7 @@ metric_utils.py
 # Necessary packages
 import numpy as np
 from metrics.general_rnn import GeneralRNN
+from data.ragged import to_padded
 from sklearn.metrics import accuracy_score, roc_auc_score
 
 def reidentify_score(enlarge_label, pred_label):
@@ -60,13 +61,15 @@ def feature_prediction (train_data, test_data, index):
   """Use the other features to predict a certain feature.
   
   Args:
-    - train_data: training time-series
-    - test_data: testing time-series
+    - train_data: training time-series (3d array or RaggedData)
+    - test_data: testing time-series (3d array or RaggedData)
     - index: feature index to be predicted
     
   Returns:
     - perf: average performance of feature predictions (in terms of AUC or MSE)
   """
+  # Pad ragged data to a common length
+  train_data, test_data = to_padded(train_data, test_data)
   
   # Parameters
   no, seq_len, dim = train_data.shape
@@ -117,12 +120,14 @@ def one_step_ahead_prediction (train_data, test_data):
   """Use the previous time-series to predict one-step ahead feature values.
   
   Args:
-    - train_data: training time-series
-    - test_data: testing time-series
+    - train_data: training time-series (3d array or RaggedData)
+    - test_data: testing time-series (3d array or RaggedData)
     
   Returns:
     - perf: average performance of one-step ahead predictions (in terms of AUC or MSE)
   """
+  # Pad ragged data to a common length
+  train_data, test_data = to_padded(train_data, test_data)
   
   # Parameters
   no, seq_len, dim = train_data.shape
@@ -16,6 +16,9 @@ binary_predictor.py
 
 Note: Make binary predictor that predict synthetic data from original enlarged data.
       Then, use the predicted scores as the distance between synthetic and real data
+
+(1) binary_predictor: Reidentify with a GRU or a gradient-boosted classifier on summary features
+(2) summary_features: Per-sequence summary features of front-padded data
 """
 
 # Necessary packages
@@ -24,22 +27,56 @@ import sys
 
 from .general_rnn import GeneralRNN
 
+try:
+  from seeker.decision import top_k_decision
+  from data.data_view import DataView
+except ImportError:
+  # Standalone starting kit (decision.py and data_view.py next to seeker.py)
+  from decision import top_k_decision
+  from data_view import DataView
+
 
-def binary_predictor (generated_data, enlarge_data):
+def binary_predictor (generated_data, enlarge_data, return_scores = False, model_type = 'gru'):
   """Find top gen_no enlarge data whose predicted scores is largest using the trained predictor.
   
   Args:
-    - generated_data: generated data points
-    - enlarge_data: train data + remaining data
+    - generated_data: generated data points (3d array or DataView)
+    - enlarge_data: train data + remaining data (3d array or DataView)
+    - return_scores: also return the predicted score of each enlarge data point
+    - model_type: gru (3-layer GRU on the sequences) or gbt (histogram gradient-boosted 
+                  trees on summary_features, a fast screening seeker)
     
   Returns:
     - reidentified_data: 1 if it is used as train data, 0 otherwise
+    - distance: predicted score of each enlarge data point (if return_scores)
   """
   
   # Parameters
   enl_no, seq_len, dim = enlarge_data.shape
   gen_no, _, _ = generated_data.shape
   
+  if model_type == 'gbt':
+    # Optional dependency, only needed by the fast seeker
+    try:
+      from sklearn.ensemble import HistGradientBoostingClassifier
+    except ImportError:
+      from sklearn.experimental import enable_hist_gradient_boosting
+      from sklearn.ensemble import HistGradientBoostingClassifier
+    
+    train_x = np.concatenate((summary_features(generated_data), summary_features(enlarge_data)), axis = 0)
+    train_y = np.concatenate((np.zeros([gen_no,]), np.ones([enl_no,])), axis = 0)
+    
+    model = HistGradientBoostingClassifier(random_state = 0)
+    model.fit(train_x, train_y)
+    
+    # Measure the distance from synthetic data using the trained model
+    distance = model.predict_proba(train_x[gen_no:])[:, 1]
+    reidentified_data = top_k_decision(distance, gen_no)
+    
+    if return_scores:
+      return reidentified_data, distance
+    return reidentified_data
+  
   # Set model parameters
   model_parameters = {'task': 'classification',
                       'model_type': 'gru',
@@ -49,12 +86,12 @@ def binary_predictor (generated_data, enlarge_data):
                       'epoch': 20,
                       'learning_rate': 0.001}
   
-  # Set training features and labels
-  train_x = np.concatenate((generated_data.copy(), enlarge_data.copy()), axis = 0)
-  train_y = np.concatenate((np.zeros([gen_no, 1]), np.ones([enl_no, 1])), axis = 0)
+  # Set training features and labels (a view, mini-batches are gathered by GeneralRNN)
+  train_x = DataView([generated_data, enlarge_data])
+  train_y = np.concatenate((np.zeros([gen_no, 1], dtype = train_x.dtype), np.ones([enl_no, 1], dtype = train_x.dtype)), axis = 0)
   
   idx = np.random.permutation(enl_no+gen_no)
-  train_x = train_x[idx, :, :]
+  train_x = train_x.subset(idx)
   train_y = train_y[idx, :]
     
   # Train the binary predictor
@@ -64,10 +101,48 @@ def binary_predictor (generated_data, enlarge_data):
   # Measure the distance from synthetic data using the trained model
   distance = general_rnn.predict(enlarge_data)
       
-  # Check the threshold distance for top gen_no for 1-NN distance
-  thresh = sorted(distance)[gen_no]
-
-  # Return the decision for reidentified data
-  reidentified_data = 1*(distance <= thresh)
+  # Reidentify the gen_no enlarge data with the smallest predicted scores
+  reidentified_data = top_k_decision(distance, gen_no)
 
+  if return_scores:
+    return reidentified_data, distance
   return reidentified_data
+
+
+def summary_features (data, pad_value = -1):
+  """Per-sequence summary features of front-padded data, in one vectorized pass.
+  
+  For each feature: mean, std, last value and least-squares slope over the observed 
+  time steps (the padding is ignored), then the length of the sequence.
+  
+  Args:
+    - data: front-padded time-series data ([no, seq_len, dim])
+    - pad_value: value of the padded time steps
+    
+  Returns:
+    - features: summary features ([no, 4 * dim + 1])
+  """
+  data = np.asarray(data, dtype = np.float64)
+  no, seq_len, dim = data.shape
+  
+  # Observed time steps (padding is the leading run of padded steps)
+  padded = np.all(data == pad_value, axis = 2)
+  pad_no = np.where(np.all(padded, axis = 1), seq_len, np.argmin(padded, axis = 1))
+  lengths = seq_len - pad_no
+  observed = (np.arange(seq_len)[None, :] >= pad_no[:, None])[:, :, None]
+  count = np.maximum(lengths, 1)[:, None]
+  
+  # Mean and std
+  mean = np.sum(np.where(observed, data, 0), axis = 1) / count
+  centered = np.where(observed, data - mean[:, None, :], 0)
+  std = np.sqrt(np.sum(centered ** 2, axis = 1) / count)
+  
+  # Last value (the last step is observed unless the sequence is empty)
+  last = np.where(lengths[:, None] > 0, data[:, -1, :], 0)
+  
+  # Least-squares slope over the time index
+  time = np.arange(seq_len)[None, :, None] - (pad_no[:, None, None] + (lengths[:, None, None] - 1) / 2)
+  time = np.where(observed, time, 0)
+  slope = np.sum(time * centered, axis = 1) / np.maximum(np.sum(time ** 2, axis = 1), 1e-12)
+  
+  return np.concatenate([mean, std, last, slope, lengths[:, None]], axis = 1)
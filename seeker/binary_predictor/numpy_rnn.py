@@ -0,0 +1,340 @@
+"""Pure-NumPy inference engine for trained GeneralRNN models.
+
+Author: Jinsung Yoon
+Contact: jsyoon0823@gmail.com
+
+-----------------------------------------------
+
+Note: Runs the forward pass of a trained GeneralRNN without TensorFlow, so that
+      prediction can run in lightweight processes (only numpy is imported).
+
+(1) quantize: Symmetric int8 quantization with one scale per output column
+(2) export_weights: Extract the weights and configuration of a trained GeneralRNN
+(3) save_weights: Save exported weights as a .npz file
+(4) load_weights: Load exported weights from a .npz file
+(5) NumpyRNN: vectorized NumPy forward pass (SimpleRNN / LSTM / GRU, masking, Dense head)
+(6) check_engine: Compare the NumPy engine with the Keras model
+"""
+
+# Necessary packages
+import json
+import numpy as np
+
+
+# Keras activations used by GeneralRNN (tf.keras 2.x definitions)
+ACTIVATIONS = {
+  'linear': lambda x: x,
+  'tanh': np.tanh,
+  'sigmoid': lambda x: 0.5 * (np.tanh(0.5 * x) + 1),
+  'hard_sigmoid': lambda x: np.clip(0.2 * x + 0.5, 0, 1),
+  'relu': lambda x: np.maximum(x, 0),
+}
+
+
+def quantize (weight):
+  """Symmetric int8 quantization with one scale per output column.
+
+  Args:
+    - weight: float weight matrix [input dim, output dim]
+
+  Returns:
+    - quantized_weight: int8 weight matrix
+    - scale: float32 scale of each output column (weight ~ quantized_weight * scale)
+  """
+  scale = np.max(np.abs(weight), axis = 0) / 127
+  scale[scale == 0] = 1
+  quantized_weight = np.round(weight / scale).astype(np.int8)
+  return quantized_weight, scale.astype(np.float32)
+
+
+def export_weights (general_rnn, quantize_weights = False):
+  """Extract the weights and configuration of a trained GeneralRNN.
+
+  Args:
+    - general_rnn: trained GeneralRNN (or its keras Sequential predictor model)
+    - quantize_weights: store the kernels as int8 (biases stay float32)
+
+  Returns:
+    - weights: dictionary with the layer configuration ('config') and the weight arrays ('arrays')
+  """
+  model = getattr(general_rnn, 'predictor_model', general_rnn)
+  config = {'mask_value': -1.0, 'layers': []}
+  arrays = {}
+
+  for layer in model.layers:
+    layer_type = type(layer).__name__
+    if layer_type == 'Masking':
+      config['mask_value'] = float(layer.mask_value)
+      continue
+
+    # TimeDistributed(Dense) applies the same Dense head to each time step
+    time_distributed = layer_type == 'TimeDistributed'
+    if time_distributed:
+      layer = layer.layer
+      layer_type = type(layer).__name__
+
+    layer_config = layer.get_config()
+    if layer_type == 'Dense':
+      entry = {'type': layer_type, 'activation': layer_config['activation'],
+               'time_distributed': time_distributed}
+      names = ['kernel', 'bias']
+    elif layer_type in ['SimpleRNN', 'LSTM', 'GRU']:
+      entry = {'type': layer_type, 'activation': layer_config['activation'],
+               'recurrent_activation': layer_config.get('recurrent_activation', 'sigmoid'),
+               'return_sequences': layer_config['return_sequences'],
+               'reset_after': layer_config.get('reset_after', False)}
+      names = ['kernel', 'recurrent_kernel', 'bias']
+    else:
+      raise ValueError('Layer {} is not supported.'.format(layer_type))
+
+    prefix = 'layer{}_'.format(len(config['layers']))
+    for name, weight in zip(names, layer.get_weights()):
+      if quantize_weights and name != 'bias':
+        arrays[prefix + name], arrays[prefix + name + '_scale'] = quantize(weight)
+      else:
+        arrays[prefix + name] = weight.astype(np.float32)
+    config['layers'].append(entry)
+
+  return {'config': config, 'arrays': arrays}
+
+
+def save_weights (file_name, weights):
+  """Save exported weights as a .npz file.
+
+  Args:
+    - file_name: .npz file name
+    - weights: exported weights (see export_weights)
+  """
+  np.savez(file_name, config = json.dumps(weights['config']), **weights['arrays'])
+
+
+def load_weights (file_name):
+  """Load exported weights from a .npz file.
+
+  Args:
+    - file_name: .npz file name
+
+  Returns:
+    - weights: exported weights (see export_weights)
+  """
+  with np.load(file_name) as saved:
+    config = json.loads(str(saved['config']))
+    arrays = {name: saved[name] for name in saved.files if name != 'config'}
+  return {'config': config, 'arrays': arrays}
+
+
+class NumpyRNN():
+  """Vectorized NumPy forward pass of an exported GeneralRNN.
+
+  The input projections of all time steps are computed with one matrix product per
+  layer, so only the recurrent product runs step by step (for the whole batch).
+  Masked time steps keep the previous state and output, as in keras.
+
+  Attributes:
+    - mask_value: value of the padded time steps
+    - layers: configuration and float32 weights of each layer (int8 weights are dequantized once)
+  """
+
+  def __init__(self, weights):
+
+    config, arrays = weights['config'], weights['arrays']
+    self.mask_value = config['mask_value']
+    self.layers = []
+
+    for i, entry in enumerate(config['layers']):
+      layer = dict(entry)
+      prefix = 'layer{}_'.format(i)
+      for name in ['kernel', 'recurrent_kernel', 'bias']:
+        if prefix + name not in arrays:
+          continue
+        weight = arrays[prefix + name].astype(np.float32)
+        if prefix + name + '_scale' in arrays:
+          weight = weight * arrays[prefix + name + '_scale']
+        layer[name] = weight
+      self.layers.append(layer)
+
+
+  def _rnn_layer(self, layer, x, mask):
+    """Forward pass of one recurrent layer.
+
+    Args:
+      - layer: layer configuration and weights
+      - x: inputs [batch, time, dim]
+      - mask: observed time steps [batch, time]
+
+    Returns:
+      - outputs: outputs of all time steps, or of the last step if not return_sequences
+    """
+    no, seq_len = x.shape[0], x.shape[1]
+    activation = ACTIVATIONS[layer['activation']]
+    recurrent_activation = ACTIVATIONS[layer['recurrent_activation']]
+    recurrent_kernel, bias = layer['recurrent_kernel'], layer['bias']
+    units = recurrent_kernel.shape[0]
+
+    # GRU with reset_after has separate input and recurrent biases
+    if bias.ndim == 2:
+      input_bias, recurrent_bias = bias[0], bias[1]
+    else:
+      input_bias, recurrent_bias = bias, None
+
+    # Input projections of all time steps at once
+    x_proj = np.matmul(x, layer['kernel']) + input_bias
+
+    h = np.zeros([no, units], dtype = np.float32)
+    c = np.zeros([no, units], dtype = np.float32)
+    outputs = np.zeros([no, seq_len, units], dtype = np.float32) if layer['return_sequences'] else None
+
+    for t in range(seq_len):
+      x_t = x_proj[:, t]
+
+      if layer['type'] == 'SimpleRNN':
+        h_new = activation(x_t + np.matmul(h, recurrent_kernel))
+        c_new = c
+      elif layer['type'] == 'LSTM':
+        z = x_t + np.matmul(h, recurrent_kernel)
+        i_gate = recurrent_activation(z[:, :units])
+        f_gate = recurrent_activation(z[:, units:(2 * units)])
+        o_gate = recurrent_activation(z[:, (3 * units):])
+        c_new = f_gate * c + i_gate * activation(z[:, (2 * units):(3 * units)])
+        h_new = o_gate * activation(c_new)
+      elif layer['type'] == 'GRU':
+        if recurrent_bias is not None:
+          h_proj = np.matmul(h, recurrent_kernel) + recurrent_bias
+          z_gate = recurrent_activation(x_t[:, :units] + h_proj[:, :units])
+          r_gate = recurrent_activation(x_t[:, units:(2 * units)] + h_proj[:, units:(2 * units)])
+          hh = activation(x_t[:, (2 * units):] + r_gate * h_proj[:, (2 * units):])
+        else:
+          h_proj = np.matmul(h, recurrent_kernel[:, :(2 * units)])
+          z_gate = recurrent_activation(x_t[:, :units] + h_proj[:, :units])
+          r_gate = recurrent_activation(x_t[:, units:(2 * units)] + h_proj[:, units:])
+          hh = activation(x_t[:, (2 * units):] + np.matmul(r_gate * h, recurrent_kernel[:, (2 * units):]))
+        h_new = z_gate * h + (1 - z_gate) * hh
+        c_new = c
+
+      # Masked time steps keep the previous state
+      mask_t = mask[:, t:(t + 1)]
+      h = np.where(mask_t, h_new, h)
+      c = np.where(mask_t, c_new, c)
+      if outputs is not None:
+        outputs[:, t] = h
+
+    return outputs if outputs is not None else h
+
+
+  def forward(self, x):
+    """Forward pass of one batch.
+
+    Args:
+      - x: front-padded features [batch, time, dim]
+
+    Returns:
+      - y_hat: predictions
+    """
+    x = np.asarray(x, dtype = np.float32)
+    mask = np.any(x != self.mask_value, axis = 2)
+
+    for layer in self.layers:
+      if layer['type'] == 'Dense':
+        x = ACTIVATIONS[layer['activation']](np.matmul(x, layer['kernel']) + layer['bias'])
+      else:
+        x = self._rnn_layer(layer, x, mask)
+
+    return x
+
+
+  def predict(self, test_x, batch_size = 1024, chunk_size = 16384):
+    """Return the predictions, with the batching of GeneralRNN.predict.
+
+    The testing set is read in chunks of consecutive rows, and each chunk is split into
+    length-bucketed batches trimmed to their longest sequence.
+
+    Args:
+      - test_x: testing features (array, memory-mapped array or DataView)
+      - batch_size: the number of samples in each batch
+      - chunk_size: the number of samples read at a time
+
+    Returns:
+      - test_y_hat: predictions on testing set
+    """
+    no, seq_len, dim = len(test_x), test_x.shape[1], test_x.shape[2]
+
+    # Output of the masked padding steps (all padded input)
+    pad_y_hat = self.forward(np.full([1, 1, dim], self.mask_value, dtype = np.float32))
+    if pad_y_hat.ndim == 3:
+      test_y_hat = np.tile(pad_y_hat, [no, seq_len, 1])
+    else:
+      test_y_hat = np.zeros([no, pad_y_hat.shape[-1]], dtype = np.float32)
+
+    for i in range(0, no, chunk_size):
+      chunk_x = np.asarray(test_x[i:(i + chunk_size)], dtype = np.float32)
+
+      # Length of each sequence after the leading padding steps
+      observed = np.any(chunk_x != self.mask_value, axis = 2)
+      lengths = np.where(np.any(observed, axis = 1), seq_len - np.argmax(observed, axis = 1), 0)
+      order = np.argsort(lengths, kind = 'stable')
+
+      for j in range(0, len(order), batch_size):
+        batch_idx = order[j:(j + batch_size)]
+        # Trim the leading padding steps shared by the whole batch
+        start = seq_len - max(int(np.max(lengths[batch_idx])), 1)
+        batch_y_hat = self.forward(chunk_x[batch_idx, start:])
+
+        # Front-pad the trimmed sequences back to seq_len
+        if batch_y_hat.ndim == 3:
+          test_y_hat[i + batch_idx, start:] = batch_y_hat
+        else:
+          test_y_hat[i + batch_idx] = batch_y_hat
+
+    return test_y_hat
+
+
+def check_engine (general_rnn, test_x, tolerance = 1e-5, quantize_weights = False):
+  """Compare the NumPy engine with the Keras model on the testing set.
+
+  Args:
+    - general_rnn: trained GeneralRNN
+    - test_x: testing features
+    - tolerance: maximum absolute difference accepted
+    - quantize_weights: check the int8 engine (not expected to match to 1e-5)
+
+  Returns:
+    - max_diff: maximum absolute difference between the two predictions
+  """
+  engine = NumpyRNN(export_weights(general_rnn, quantize_weights))
+  max_diff = float(np.max(np.abs(engine.predict(test_x) - general_rnn.predict(test_x))))
+
+  print('NumPy engine max abs difference: ' + str(max_diff) +
+        (' (OK)' if max_diff <= tolerance else ' (above ' + str(tolerance) + ')'))
+
+  return max_diff
+
+
+###
+if __name__ == '__main__':
+
+  from general_rnn import GeneralRNN
+
+  # Random front-padded data
+  no, seq_len, dim = 512, 20, 5
+  x = np.random.rand(no, seq_len, dim).astype(np.float32)
+  lengths = np.random.randint(1, seq_len + 1, no)
+  x[np.arange(seq_len)[None, :] < (seq_len - lengths)[:, None]] = -1
+  y = np.random.randint(0, 2, [no, 1]).astype(np.float32)
+
+  for model_type in ['rnn', 'lstm', 'gru']:
+    model_parameters = {'task': 'classification', 'model_type': model_type, 'h_dim': dim,
+                        'n_layer': 3, 'batch_size': 128, 'epoch': 1, 'learning_rate': 0.001}
+    general_rnn = GeneralRNN(model_parameters)
+    general_rnn.fit(x, y)
+    print(model_type + ':')
+    assert check_engine(general_rnn, x) <= 1e-5
+    check_engine(general_rnn, x, quantize_weights = True)
+
+  # GRU without reset_after (the tf.keras 1.x default, not built by GeneralRNN)
+  import tensorflow as tf
+  model = tf.keras.Sequential([tf.keras.layers.Masking(mask_value = -1., input_shape = (None, dim))] + 
+                              [tf.keras.layers.GRU(dim, return_sequences = True, reset_after = False) for _ in range(2)] + 
+                              [tf.keras.layers.GRU(dim, reset_after = False), tf.keras.layers.Dense(1, activation = 'sigmoid')])
+  general_rnn.predictor_model, general_rnn.forward_fn = model, None
+  print('gru (reset_after = False):')
+  assert check_engine(general_rnn, x) <= 1e-5
@@ -0,0 +1,64 @@
+"""Hide-and-Seek Privacy Challenge Codebase.
+
+Reference: James Jordon, Daniel Jarrett, Jinsung Yoon, Ari Ercole, Cheng Zhang, Danielle Belgrave, Mihaela van der Schaar,
+"Hide-and-Seek Privacy Challenge: Synthetic Data Generation vs. Patient Re-identification with Clinical Time-series Data,"
+Neural Information Processing Systems (NeurIPS) Competition, 2020.
+
+Link: https://www.vanderschaar-lab.com/announcing-the-neurips-2020-hide-and-seek-privacy-challenge/
+
+Last updated Date: June 21th 2020
+Code author: Jinsung Yoon
+Contact: jsyoon0823@gmail.com
+
+-----------------------------
+
+decision.py
+
+Note: Membership decision shared by the seekers (and available to user seekers)
+
+(1) top_k_decision: Reidentify exactly k data points with the smallest (or largest) scores
+"""
+
+# Necessary packages
+import numpy as np
+
+
+def top_k_decision (scores, k, largest = False):
+  """Reidentify exactly k data points with the smallest (or largest) scores.
+
+  The k-th score is found with np.partition in O(n). Ties at the k-th score are
+  broken by the lower index, so exactly k data points are reidentified and the
+  decision is deterministic. Missing scores (NaN) are ranked last.
+
+  Args:
+    - scores: score of each data point (integer or float array, or memory-mapped array, [no,] or [no, 1])
+    - k: the number of reidentified data points
+    - largest: reidentify the largest scores instead of the smallest
+
+  Returns:
+    - reidentified_data: 1 if it is reidentified (used as train data), 0 otherwise
+  """
+  # float64 key, so that integer scores can be negated and ranked with inf
+  key = np.asarray(scores, dtype = np.float64).reshape(-1)
+  no = len(key)
+  k = int(min(max(k, 0), no))
+
+  # Output initialization
+  reidentified_data = np.zeros([no,], dtype = int)
+  if k == 0:
+    return reidentified_data
+
+  # Ranking key: smaller is reidentified first (NaN last)
+  key = -key if largest else key.copy()
+  key[np.isnan(key)] = np.inf
+
+  # k-th smallest key
+  thresh = np.partition(key, k - 1)[k - 1]
+
+  # All scores below the threshold, then the ties with the lowest indices
+  below = key < thresh
+  ties = np.nonzero(key == thresh)[0][:(k - np.sum(below))]
+  reidentified_data[below] = 1
+  reidentified_data[ties] = 1
+
+  return reidentified_data
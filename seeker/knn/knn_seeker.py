@@ -15,49 +15,848 @@ Contact: jsyoon0823@gmail.com
 knn_seeker.py
 
 Note: Find top gen_no enlarge data whose distance from 1-NN generated_data is smallest
+
+(1) knn_seeker: Reidentify the enlarge data closest to the generated data
+(2) nn_search: 1-NN distance with the selected index backend
+(3) nn_distance: Tiled 1-NN distance with a running minimum (exact brute force)
+(4) tree_distance: 1-NN distance with a KD tree or a ball tree (exact)
+(5) rp_forest_distance: 1-NN distance with a random projection forest (approximate)
+(6) rp_tree: Build a random projection tree with median splits
+(7) row_sq_norms: Squared norm of each row, read in blocks
+(8) dtw_nn_distance: 1-NN DTW distance with lower-bound pruning and early abandoning
+(9) batch_dtw: Banded DTW of a query against a batch of candidates with early abandoning
+(10) start_aligned: Move the observed time steps of front-padded data to the start
+(11) QuantizedData: Compressed data points (int8 scalar or product quantization)
+(12) quantized_distance: 1-NN distance over quantized reference data with exact re-ranking
+(13) pq_codebooks: Train the product quantization codebooks with k-means
+(14) knn_distances: The k smallest distances of each query point in one tiled pass
+(15) knn_statistic: Neighbour statistic of each query point from its k smallest distances
 """
 
 # Necessary packages
+import os
+import time
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+  from seeker.decision import top_k_decision
+except ImportError:
+  # Standalone starting kit (decision.py next to this file)
+  from decision import top_k_decision
 
 
-def knn_seeker (generated_data, enlarge_data):
+def knn_seeker (generated_data, enlarge_data, backend = 'brute', tile_size = 1024, 
+                leaf_size = 40, n_trees = 10, recall_sample = 100, seed = 0, n_jobs = 1, 
+                return_scores = False, metric = 'euclidean', window = 10, rerank = 10, pq_sub_dim = 4, 
+                k = 1, statistic = 'kth'):
   """Find top gen_no enlarge data whose distance from 1-NN generated_data is smallest
   
+  Memory-mapped inputs (or .npy file names, which are memory-mapped) are streamed: 
+  only the current tiles and the per-row running minima are kept in memory, and the 
+  number of bytes read is printed.
+  
   Args:
-    - generated_data: generated data points
-    - enlarge_data: train data + remaining data
+    - generated_data: generated data points (3d array, RaggedData or .npy file name)
+    - enlarge_data: train data + remaining data (3d array, RaggedData or .npy file name)
+    - backend: nearest-neighbour index over the generated data (see nn_search)
+    - tile_size: the number of rows of each dataset in a distance tile (see nn_distance)
+    - leaf_size: the maximum number of points in a leaf (tree backends)
+    - n_trees: the number of trees of the rp_forest backend (more is slower, with higher recall)
+    - recall_sample: the number of enlarge data points used to measure the rp_forest recall
+    - seed: random seed of the rp_forest backend
+    - n_jobs: the number of threads of the brute backend (-1 for all cores)
+    - return_scores: also return the 1-NN distance of each enlarge data point
+    - metric: euclidean (on the front-padded sequences) or dtw (on the observed time steps)
+    - window: Sakoe-Chiba band of the dtw metric (see dtw_nn_distance)
+    - rerank: the number of candidates re-ranked exactly (sq8 and pq backends)
+    - pq_sub_dim: the number of dimensions of each product quantization subspace
+    - k: the number of nearest generated data points (k > 1 uses knn_distances, euclidean brute force)
+    - statistic: score computed from the k distances (see knn_statistic)
     
   Returns:
     - reidentified_data: 1 if it is used as train data, 0 otherwise
+    - distance: score (1-NN distance if k = 1) of each enlarge data point (if return_scores)
   """
   
+  # Memory-map .npy files
+  if isinstance(generated_data, str): generated_data = np.load(generated_data, mmap_mode = 'r')
+  if isinstance(enlarge_data, str): enlarge_data = np.load(enlarge_data, mmap_mode = 'r')
+  streaming = isinstance(generated_data, np.memmap) or isinstance(enlarge_data, np.memmap)
+  
+  # Ragged data (see data/ragged.py) is front-padded to a common length
+  if hasattr(generated_data, 'pad') or hasattr(enlarge_data, 'pad'):
+    seq_len = max([data.max_seq_len if hasattr(data, 'pad') else data.shape[1] 
+                   for data in (generated_data, enlarge_data)])
+    if hasattr(generated_data, 'pad'): generated_data = generated_data.pad(max_seq_len = seq_len)
+    if hasattr(enlarge_data, 'pad'): enlarge_data = enlarge_data.pad(max_seq_len = seq_len)
+  
   # Parameters
   enl_no, seq_len, dim = enlarge_data.shape
   gen_no, _, _ = generated_data.shape
   
-  # Reshape to 2d array
+  # DTW on the observed time steps (the -1 padding is ignored)
+  if metric == 'dtw':
+    enlarge_seqs, enlarge_lengths = start_aligned(enlarge_data)
+    generated_seqs, generated_lengths = start_aligned(generated_data)
+    distance = dtw_nn_distance(enlarge_seqs, enlarge_lengths, generated_seqs, generated_lengths, window)
+    reidentified_data = top_k_decision(distance, gen_no)
+    if return_scores:
+      return reidentified_data, distance
+    return reidentified_data
+  
+  # Reshape to 2d array (a view, so memory-mapped data is not loaded)
   enlarge_data = np.reshape(enlarge_data, [enl_no, seq_len * dim])
   generated_data = np.reshape(generated_data, [gen_no, seq_len * dim])
   
+  # Distance from 1-NN generated data
+  if k > 1:
+    distances = knn_distances(enlarge_data, generated_data, k, tile_size, n_jobs)
+    # Distances between the enlarge data points (the first neighbour is the point itself)
+    enlarge_distances = knn_distances(enlarge_data, enlarge_data, k + 1, tile_size, n_jobs)[:, 1:] \
+                        if statistic == 'ratio' else None
+    distance = knn_statistic(distances, statistic, enlarge_distances)
+  elif streaming and backend == 'brute':
+    distance, bytes_read = nn_distance(enlarge_data, generated_data, tile_size, n_jobs, return_bytes_read = True)
+    print('KNN seeker read ' + str(np.round(bytes_read / 2**20, 1)) + 'MB ' + 
+          '(data size: ' + str(np.round((enlarge_data.nbytes + generated_data.nbytes) / 2**20, 1)) + 'MB)')
+  else:
+    distance = nn_search(enlarge_data, generated_data, backend, tile_size = tile_size, leaf_size = leaf_size, 
+                         n_trees = n_trees, recall_sample = recall_sample, seed = seed, n_jobs = n_jobs, 
+                         rerank = rerank, pq_sub_dim = pq_sub_dim)
+  
+  # Reidentify the gen_no enlarge data with the smallest 1-NN distance
+  reidentified_data = top_k_decision(distance, gen_no)
+
+  if return_scores:
+    return reidentified_data, distance
+  return reidentified_data
+
+
+def nn_search (query_data, ref_data, backend = 'brute', tile_size = 1024, leaf_size = 40, n_trees = 10, 
+               recall_sample = 100, seed = 0, n_jobs = 1, rerank = 10, pq_sub_dim = 4):
+  """1-NN distance with the selected index backend.
+  
+  Backends:
+    - brute: tiled brute force (exact, see nn_distance)
+    - kd_tree, ball_tree: sklearn trees over the reference data (exact up to rounding)
+    - rp_forest: random projection forest (approximate)
+    - sq8, pq: int8 scalar or product quantization of the reference data with exact 
+      re-ranking (approximate, see quantized_distance)
+  The recall of the approximate backends against brute force is measured on 
+  recall_sample query points and printed.
+  
+  Args:
+    - query_data: query data points ([query_no, dim])
+    - ref_data: reference data points ([ref_no, dim])
+    - backend: brute, kd_tree, ball_tree, rp_forest, sq8 or pq
+    - tile_size: the number of rows of each dataset in a distance tile
+    - leaf_size: the maximum number of points in a leaf (tree backends)
+    - n_trees: the number of random projection trees
+    - recall_sample: the number of query points used to measure the recall (rp_forest)
+    - seed: random seed (rp_forest and pq)
+    - n_jobs: the number of threads of the brute force search (-1 for all cores)
+    - rerank: the number of candidates re-ranked exactly (sq8 and pq)
+    - pq_sub_dim: the number of dimensions of each product quantization subspace
+    
+  Returns:
+    - distance: distance from 1-NN reference point ([query_no,])
+  """
+  assert backend in ['brute', 'kd_tree', 'ball_tree', 'rp_forest', 'sq8', 'pq']
+  
+  if backend == 'brute':
+    return nn_distance(query_data, ref_data, tile_size, n_jobs)
+  if backend in ['kd_tree', 'ball_tree']:
+    return tree_distance(query_data, ref_data, backend, leaf_size)
+  
+  if backend == 'rp_forest':
+    distance = rp_forest_distance(query_data, ref_data, n_trees, leaf_size, seed)
+  else:
+    quantized_data = QuantizedData(ref_data, backend, pq_sub_dim, seed = seed)
+    distance = quantized_distance(query_data, ref_data, quantized_data, rerank, tile_size)
+  
+  # Recall: share of the sampled query points whose exact 1-NN distance is found
+  if recall_sample > 0:
+    sample_idx = np.random.RandomState(seed).permutation(len(query_data))[:recall_sample]
+    exact_distance = nn_distance(query_data[sample_idx], ref_data, tile_size, n_jobs)
+    recall = np.mean(np.isclose(distance[sample_idx], exact_distance, rtol = 1e-6, atol = 1e-4))
+    print(backend + ' recall (' + str(len(sample_idx)) + ' samples): ' + str(np.round(recall, 4)))
+    
+  return distance
+
+
+def nn_distance (query_data, ref_data, tile_size = 1024, n_jobs = 1, return_bytes_read = False):
+  """Euclidean distance from each query point to its 1-NN reference point.
+  
+  Squared distances are computed tile by tile with ||a||^2 + ||b||^2 - 2ab (in float64), 
+  keeping a running minimum for each query point, so only a tile_size x tile_size 
+  block is stored at a time. The pairs which can still be the 1-NN within the float64 
+  rounding error bound of each pair are then recomputed directly from their 
+  differences (one vectorized reduction per tile), so the distances do not suffer 
+  from the cancellation of the expansion.
+  
+  Row tiles are independent and run in a thread pool if n_jobs > 1 (the matrix 
+  products release the GIL), sharing the data without copies. The inputs are only 
+  read tile by tile, so they can be memory-mapped arrays larger than memory.
+  
+  Args:
+    - query_data: query data points ([query_no, dim])
+    - ref_data: reference data points ([ref_no, dim])
+    - tile_size: the number of rows of each dataset in a distance tile
+    - n_jobs: the number of threads (-1 for all cores)
+    - return_bytes_read: also return the number of bytes read from the inputs
+    
+  Returns:
+    - distance: distance from 1-NN reference point ([query_no,])
+    - bytes_read: the number of bytes read from the inputs (if return_bytes_read)
+  """
+  query_no, dim = query_data.shape
+  ref_no = len(ref_data)
+  
+  query_sq = row_sq_norms(query_data, tile_size)
+  ref_sq = row_sq_norms(ref_data, tile_size)
+  
+  # Rounding error bound of the float64 squared distance of a pair, relative to ||a||^2 + ||b||^2
+  rel_tol = (dim + 2) * np.finfo(np.float64).eps
+  
   # Output initialization
-  distance = np.zeros([enl_no,])
-  
-  # For each data point in enlarge dataset
-  for i in range(enl_no):
-    temp_dist = list()
-    # For each generated data point
-    for j in range(gen_no):
-      # Check the distacne between data points in enlarge dataset and generated dataset
-      tempo = np.linalg.norm(enlarge_data[i, :] - generated_data[j, :])
-      temp_dist.append(tempo)
-    # Find the minimum distance from 1-NN generated data
-    distance[i] = np.min(temp_dist)
-  
-  # Check the threshold distance for top gen_no for 1-NN distance
-  thresh = sorted(distance)[gen_no]
-
-  # Return the decision for reidentified data
-  reidentified_data = 1*(distance <= thresh)
-
-  return reidentified_data
\ No newline at end of file
+  distance = np.full([query_no,], np.inf)
+  
+  def tile_distance(i):
+    """1-NN distance of the query rows of the tile starting at row i (returns the bytes read)."""
+    query_tile = query_data[i:(i + tile_size)].astype(np.float64)
+    bytes_read = query_data[i:(i + tile_size)].nbytes + ref_data.nbytes
+    # Running minimum of the upper bounds of the squared distances of the tile rows
+    best_sq = np.full([len(query_tile),], np.inf)
+    best_distance = np.full([len(query_tile),], np.inf)
+    
+    for j in range(0, ref_no, tile_size):
+      ref_tile = ref_data[j:(j + tile_size)].astype(np.float64)
+      norm_sq = query_sq[i:(i + tile_size), None] + ref_sq[None, j:(j + tile_size)]
+      sq_dist = norm_sq - 2 * (query_tile @ ref_tile.T)
+      tol = rel_tol * norm_sq
+      best_sq = np.minimum(best_sq, np.min(sq_dist + tol, axis = 1))
+      
+      # Exact distance of the candidate pairs which can still be the 1-NN
+      rows, cols = np.nonzero(sq_dist - tol <= best_sq[:, None])
+      diff = query_tile[rows] - ref_tile[cols]
+      np.minimum.at(best_distance, rows, np.sqrt(np.einsum('ij,ij->i', diff, diff)))
+      
+    distance[i:(i + tile_size)] = best_distance
+    return bytes_read
+  
+  # Each row tile only writes its own rows, so the result does not depend on n_jobs
+  if n_jobs == -1:
+    n_jobs = os.cpu_count()
+  if n_jobs > 1:
+    with ThreadPoolExecutor(max_workers = n_jobs) as executor:
+      tile_bytes = list(executor.map(tile_distance, range(0, query_no, tile_size)))
+  else:
+    tile_bytes = [tile_distance(i) for i in range(0, query_no, tile_size)]
+  
+  if return_bytes_read:
+    # Norm pass plus the tiles
+    return distance, query_data.nbytes + ref_data.nbytes + sum(tile_bytes)
+  return distance
+
+
+def tree_distance (query_data, ref_data, backend = 'kd_tree', leaf_size = 40):
+  """1-NN distance with a KD tree or a ball tree over the reference data (exact).
+  
+  Args:
+    - query_data: query data points ([query_no, dim])
+    - ref_data: reference data points ([ref_no, dim])
+    - backend: kd_tree or ball_tree
+    - leaf_size: the maximum number of points in a leaf
+    
+  Returns:
+    - distance: distance from 1-NN reference point ([query_no,])
+  """
+  # Optional dependency, so that the brute force seeker only needs numpy
+  from sklearn.neighbors import KDTree, BallTree
+  
+  tree_class = KDTree if backend == 'kd_tree' else BallTree
+  tree = tree_class(ref_data, leaf_size = leaf_size)
+  distance, _ = tree.query(query_data, k = 1)
+  
+  return distance[:, 0]
+
+
+def rp_forest_distance (query_data, ref_data, n_trees = 10, leaf_size = 40, seed = 0, batch_size = 32):
+  """1-NN distance with a random projection forest (approximate).
+  
+  Each query point is routed to one leaf of each tree, and the distance to the 
+  reference points of these leaves is computed exactly. More trees visit more 
+  candidates, which is slower but finds the exact 1-NN more often.
+  
+  Args:
+    - query_data: query data points ([query_no, dim])
+    - ref_data: reference data points ([ref_no, dim])
+    - n_trees: the number of random projection trees
+    - leaf_size: the maximum number of points in a leaf
+    - seed: random seed
+    - batch_size: the number of query points routed and compared at a time
+    
+  Returns:
+    - distance: distance from (approximate) 1-NN reference point ([query_no,])
+  """
+  random_state = np.random.RandomState(seed)
+  ref_sq = row_sq_norms(ref_data)
+  trees = [rp_tree(ref_data, leaf_size, random_state) for _ in range(n_trees)]
+  
+  # Output initialization
+  distance = np.zeros([len(query_data),])
+  
+  for i in range(0, len(query_data), batch_size):
+    query_batch = query_data[i:(i + batch_size)].astype(np.float64)
+    query_sq = np.einsum('ij,ij->i', query_batch, query_batch)
+    best_sq = np.full([len(query_batch),], np.inf)
+    
+    for directions, thresholds, leaves in trees:
+      # Route to a leaf
+      node = np.zeros([len(query_batch),], dtype = int)
+      for _ in range(int(np.log2(len(leaves)))):
+        proj = np.einsum('ij,ij->i', query_batch, directions[node])
+        node = 2 * node + 1 + (proj >= thresholds[node])
+      candidates = leaves[node - (len(leaves) - 1)]
+      
+      # Squared distance to the reference points of the leaf ([batch, leaf_size], inf if empty)
+      cand_idx = np.maximum(candidates, 0)
+      sq_dist = query_sq[:, None] + ref_sq[cand_idx] - \
+                2 * np.einsum('ij,ikj->ik', query_batch, ref_data[cand_idx].astype(np.float64))
+      sq_dist[candidates < 0] = np.inf
+      best_sq = np.minimum(best_sq, np.min(sq_dist, axis = 1))
+      
+    distance[i:(i + batch_size)] = np.sqrt(np.maximum(best_sq, 0))
+    
+  return distance
+
+
+def rp_tree (data, leaf_size, random_state):
+  """Build a random projection tree with median splits.
+  
+  The tree is complete (heap order), so every query point is routed through the same 
+  number of levels. Each internal node splits its points at the median of their 
+  projection on a random direction.
+  
+  Args:
+    - data: data points ([no, dim])
+    - leaf_size: the maximum number of points in a leaf
+    - random_state: numpy RandomState
+    
+  Returns:
+    - directions: random direction of each internal node ([n_internal, dim])
+    - thresholds: split threshold of each internal node ([n_internal,])
+    - leaves: data points of each leaf ([n_leaves, leaf_size], -1 if empty)
+  """
+  no, dim = data.shape
+  depth = int(np.ceil(np.log2(max(no / leaf_size, 1))))
+  
+  directions = random_state.randn(2 ** depth - 1, dim)
+  thresholds = np.zeros([2 ** depth - 1,])
+  
+  # Points of each node are a contiguous segment of order
+  order = np.arange(no)
+  bounds = [0, no]
+  for level in range(depth):
+    new_bounds = [0]
+    for k in range(2 ** level):
+      node = 2 ** level - 1 + k
+      start, end = bounds[k], bounds[k + 1]
+      mid = (start + end) // 2
+      proj = data[order[start:end]].astype(np.float64) @ directions[node]
+      split = np.argpartition(proj, mid - start) if end > start else np.zeros([0,], dtype = int)
+      order[start:end] = order[start:end][split]
+      thresholds[node] = proj[split[mid - start]] if mid < end else 0
+      new_bounds += [mid, end]
+    bounds = new_bounds
+  
+  # Leaves ([n_leaves, leaf_size], padded with -1)
+  leaves = np.full([2 ** depth, leaf_size], -1, dtype = int)
+  for k in range(2 ** depth):
+    leaves[k, :(bounds[k + 1] - bounds[k])] = order[bounds[k]:bounds[k + 1]]
+  
+  return directions, thresholds, leaves
+
+
+def row_sq_norms (data, block_size = 1024):
+  """Squared norm of each row in float64, read in blocks (memory-mapped data is not loaded).
+  
+  Args:
+    - data: data points ([no, dim])
+    - block_size: the number of rows read at a time
+    
+  Returns:
+    - sq_norms: squared norm of each row ([no,])
+  """
+  sq_norms = np.zeros([len(data),])
+  for i in range(0, len(data), block_size):
+    block = data[i:(i + block_size)].astype(np.float64)
+    sq_norms[i:(i + block_size)] = np.einsum('ij,ij->i', block, block)
+  return sq_norms
+
+
+def dtw_nn_distance (query_seqs, query_lengths, ref_seqs, ref_lengths, window = 10, batch_size = 64):
+  """1-NN DTW distance with lower-bound pruning and early abandoning.
+  
+  The DTW cost is the squared Euclidean distance between time steps, the warping 
+  path stays within a Sakoe-Chiba band of max(window, |n - m|) around the diagonal 
+  (so sequences of lengths n and m can always be aligned), and the distance is the 
+  square root of the path cost. For each query sequence:
+    1. LB_Kim (first and last steps) is computed against all reference sequences,
+       which are visited in increasing LB_Kim until it exceeds the best distance.
+    2. LB_Keogh against the envelope of each visited reference sequence prunes more
+       candidates (only for |n - m| <= window, where the band is window).
+    3. The DTW of the remaining candidates is abandoned as soon as every path 
+       already costs more than the best distance.
+  The pruning rates and throughput are printed.
+  
+  Args:
+    - query_seqs: start-aligned query sequences ([query_no, seq_len, dim])
+    - query_lengths: length of each query sequence
+    - ref_seqs: start-aligned reference sequences ([ref_no, seq_len, dim])
+    - ref_lengths: length of each reference sequence
+    - window: Sakoe-Chiba band
+    - batch_size: the number of candidates bounded and aligned at a time
+    
+  Returns:
+    - distance: DTW distance from 1-NN reference sequence ([query_no,])
+  """
+  query_no, ref_no = len(query_seqs), len(ref_seqs)
+  ref_seqs = ref_seqs.astype(np.float64)
+  # A sequence without observed steps keeps its first (padded) step, as the queries
+  ref_lengths = np.maximum(ref_lengths, 1)
+  
+  # First and last observed time step of each reference sequence
+  ref_first = ref_seqs[:, 0, :]
+  ref_last = ref_seqs[np.arange(ref_no), ref_lengths - 1, :]
+  
+  # Output initialization
+  distance = np.zeros([query_no,])
+  # Pairs pruned by LB_Kim, pruned by LB_Keogh, abandoned in DTW and fully aligned
+  counts = np.zeros([4,], dtype = np.int64)
+  start_time = time.time()
+  
+  for i in range(query_no):
+    # A sequence without observed steps keeps its first (padded) step
+    n = max(query_lengths[i], 1)
+    query = query_seqs[i, :n].astype(np.float64)
+    
+    # LB_Kim: the first and the last steps are always aligned
+    lb_kim = np.sum((ref_first - query[0]) ** 2, axis = 1)
+    lb_kim += np.where((n > 1) | (ref_lengths > 1), np.sum((ref_last - query[-1]) ** 2, axis = 1), 0)
+    order = np.argsort(lb_kim, kind = 'stable')
+    
+    best = np.inf
+    visited = 0
+    for b in range(0, ref_no, batch_size):
+      cand = order[b:(b + batch_size)]
+      cand = cand[lb_kim[cand] < best]
+      if len(cand) == 0:
+        break
+      visited += len(cand)
+      
+      # LB_Keogh against the envelope of each candidate ([len(cand), n, dim])
+      cand_seqs, cand_lengths = ref_seqs[cand], ref_lengths[cand]
+      upper = np.full([len(cand), n, ref_seqs.shape[2]], -np.inf)
+      lower = np.full([len(cand), n, ref_seqs.shape[2]], np.inf)
+      steps = np.arange(n)
+      for offset in range(-window, window + 1):
+        j = steps + offset
+        valid = (j >= 0) & (j[None, :] < cand_lengths[:, None])
+        values = cand_seqs[:, np.clip(j, 0, ref_seqs.shape[1] - 1), :]
+        upper = np.where(valid[:, :, None], np.maximum(upper, values), upper)
+        lower = np.where(valid[:, :, None], np.minimum(lower, values), lower)
+      lb_keogh = np.sum(np.maximum(query[None] - upper, 0) ** 2 + np.maximum(lower - query[None], 0) ** 2, axis = (1, 2))
+      lb_keogh = np.where(np.abs(n - cand_lengths) <= window, lb_keogh, lb_kim[cand])
+      
+      keep = lb_keogh < best
+      counts[1] += np.sum(~keep)
+      cand = cand[keep]
+      if len(cand) == 0:
+        continue
+      
+      # Banded DTW with early abandoning
+      cost = batch_dtw(query, cand_seqs[keep], cand_lengths[keep], window, best)
+      counts[2] += np.sum(np.isinf(cost))
+      counts[3] += np.sum(~np.isinf(cost))
+      best = min(best, np.min(cost))
+      
+    counts[0] += ref_no - visited
+    distance[i] = np.sqrt(best)
+  
+  # Pruning rates and throughput
+  elapsed = max(time.time() - start_time, 1e-9)
+  rates = counts / max(query_no * ref_no, 1)
+  print('DTW seeker pruning: LB_Kim ' + str(np.round(rates[0], 4)) + 
+        ', LB_Keogh ' + str(np.round(rates[1], 4)) + 
+        ', early abandoned ' + str(np.round(rates[2], 4)) + 
+        ', fully aligned ' + str(np.round(rates[3], 4)))
+  print('DTW seeker throughput: ' + str(np.round(query_no * ref_no / elapsed, 1)) + ' pairs/s, ' + 
+        str(np.round(query_no / elapsed, 2)) + ' queries/s')
+  
+  return distance
+
+
+def batch_dtw (query, cands, cand_lengths, window, best = np.inf):
+  """Banded DTW of a query against a batch of candidates with early abandoning.
+  
+  The cells are filled anti-diagonal by anti-diagonal for the whole batch. Every 
+  warping path crosses one of two consecutive anti-diagonals, so a candidate is 
+  abandoned once both of them cost at least best.
+  
+  Args:
+    - query: observed time steps of the query ([n, dim])
+    - cands: start-aligned candidate sequences ([batch, seq_len, dim])
+    - cand_lengths: length of each candidate
+    - window: Sakoe-Chiba band (widened to |n - m| for each candidate)
+    - best: best cost so far (abandon threshold)
+    
+  Returns:
+    - cost: DTW cost (squared) of each candidate, inf if abandoned
+  """
+  n = len(query)
+  batch, seq_len, _ = cands.shape
+  
+  # Cost of each cell (||a||^2 + ||b||^2 - 2ab), inf outside the band and after the end of each candidate
+  cell_cost = np.sum(query ** 2, axis = 1)[None, :, None] + np.sum(cands ** 2, axis = 2)[:, None, :] - \
+              2 * np.einsum('id,bjd->bij', query, cands)
+  cell_cost = np.maximum(cell_cost, 0)
+  steps_i, steps_j = np.arange(n)[:, None], np.arange(seq_len)[None, :]
+  band = np.maximum(window, np.abs(n - cand_lengths))
+  valid = (np.abs(steps_i - steps_j)[None] <= band[:, None, None]) & (steps_j[None] < cand_lengths[:, None, None])
+  cell_cost[~valid] = np.inf
+  
+  # Cumulative cost (shifted by one, D[0, 0] = 0)
+  cum_cost = np.full([batch, n + 1, seq_len + 1], np.inf)
+  cum_cost[:, 0, 0] = 0
+  alive = np.ones([batch,], dtype = bool)
+  prev_min = np.full([batch,], np.inf)
+  # Anti-diagonal of the last cell of each candidate
+  last_k = n + cand_lengths - 2
+  
+  for k in range(int(np.max(last_k)) + 1):
+    ii = np.arange(max(0, k - seq_len + 1), min(n - 1, k) + 1) + 1
+    jj = k - ii + 2
+    cum_cost[:, ii, jj] = cell_cost[:, ii - 1, jj - 1] + np.minimum(np.minimum(cum_cost[:, ii - 1, jj - 1], 
+                                                                               cum_cost[:, ii - 1, jj]), 
+                                                                    cum_cost[:, ii, jj - 1])
+    # Early abandoning (only until the last cell of each candidate)
+    curr_min = np.min(cum_cost[:, ii, jj], axis = 1)
+    alive &= (k > last_k) | (np.minimum(curr_min, prev_min) < best)
+    prev_min = curr_min
+    if not np.any(alive & (k < last_k)):
+      break
+  
+  cost = cum_cost[np.arange(batch), n, cand_lengths]
+  cost[~alive] = np.inf
+  
+  return cost
+
+
+def start_aligned (data, pad_value = -1):
+  """Move the observed time steps of front-padded data to the start.
+  
+  Args:
+    - data: front-padded time-series data ([no, seq_len, dim])
+    - pad_value: value of the padded time steps
+    
+  Returns:
+    - aligned_data: observed time steps first, then padding ([no, seq_len, dim])
+    - lengths: the number of observed time steps of each sequence
+  """
+  no, seq_len, dim = data.shape
+  padded = np.all(np.asarray(data) == pad_value, axis = 2)
+  # Padding is the leading run of padded time steps
+  pad_no = np.where(np.all(padded, axis = 1), seq_len, np.argmin(padded, axis = 1))
+  lengths = seq_len - pad_no
+  
+  time_idx = np.minimum(np.arange(seq_len)[None, :] + pad_no[:, None], seq_len - 1)
+  aligned_data = np.take_along_axis(np.asarray(data), time_idx[:, :, None], axis = 1)
+  
+  return aligned_data, lengths
+
+
+class QuantizedData():
+  """Compressed data points (int8 scalar or product quantization).
+
+  - sq8: each dimension is scaled to its min/max range and stored in one byte.
+  - pq: the dimensions are split into subspaces of sub_dim dimensions, and each 
+    subspace stores the index (one byte) of its nearest k-means centroid.
+
+  Attributes:
+    - mode: sq8 or pq
+    - codes: codes of the data points ([no, dim] for sq8, [no, n_subspaces] for pq, uint8)
+    - dim: the number of dimensions of the data points
+  """
+
+  def __init__(self, data, mode = 'sq8', sub_dim = 4, block_size = 1024, seed = 0):
+
+    assert mode in ['sq8', 'pq']
+    self.mode = mode
+    no, self.dim = data.shape
+
+    if mode == 'sq8':
+      # Per-dimension range (read in blocks)
+      self.data_min = np.full([self.dim,], np.inf)
+      data_max = np.full([self.dim,], -np.inf)
+      for i in range(0, no, block_size):
+        self.data_min = np.minimum(self.data_min, np.min(data[i:(i + block_size)], axis = 0))
+        data_max = np.maximum(data_max, np.max(data[i:(i + block_size)], axis = 0))
+      self.scale = np.maximum(data_max - self.data_min, 1e-12) / 255
+    else:
+      self.sub_dim = sub_dim
+      self.codebooks = pq_codebooks(data, sub_dim, seed = seed)
+
+    # Encode in blocks
+    n_codes = self.dim if mode == 'sq8' else len(self.codebooks)
+    self.codes = np.zeros([no, n_codes], dtype = np.uint8)
+    for i in range(0, no, block_size):
+      self.codes[i:(i + block_size)] = self.encode(data[i:(i + block_size)])
+
+
+  def encode(self, data):
+    """Codes of the data points."""
+    if self.mode == 'sq8':
+      return np.clip(np.round((data - self.data_min) / self.scale), 0, 255).astype(np.uint8)
+
+    sub_data = self._subspaces(data)
+    codes = np.zeros([len(data), len(self.codebooks)], dtype = np.uint8)
+    for m, codebook in enumerate(self.codebooks):
+      sq_dist = np.sum(codebook ** 2, axis = 1)[None, :] - 2 * sub_data[:, m, :] @ codebook.T
+      codes[:, m] = np.argmin(sq_dist, axis = 1)
+    return codes
+
+
+  def decode(self, idx):
+    """Reconstructed data points of the selected rows (float64)."""
+    codes = self.codes[idx]
+    if self.mode == 'sq8':
+      return codes * self.scale + self.data_min
+
+    sub_data = self.codebooks[np.arange(len(self.codebooks))[None, :], codes]
+    return np.reshape(sub_data, [len(codes), -1])[:, :self.dim]
+
+
+  @property
+  def nbytes(self):
+    return self.codes.nbytes
+
+
+  def _subspaces(self, data):
+    """Split the data points into subspaces ([no, n_subspaces, sub_dim], zero-padded)."""
+    n_subspaces = int(np.ceil(self.dim / self.sub_dim))
+    padded = np.zeros([len(data), n_subspaces * self.sub_dim])
+    padded[:, :self.dim] = data
+    return np.reshape(padded, [len(data), n_subspaces, self.sub_dim])
+
+
+def pq_codebooks (data, sub_dim = 4, n_centroids = 256, n_iter = 8, sample_no = 5000, seed = 0):
+  """Train the product quantization codebooks with k-means on a sample of the data.
+  
+  Args:
+    - data: data points ([no, dim])
+    - sub_dim: the number of dimensions of each subspace
+    - n_centroids: the number of centroids of each subspace (at most 256)
+    - n_iter: the number of k-means iterations
+    - sample_no: the number of data points used for training
+    - seed: random seed
+    
+  Returns:
+    - codebooks: centroids of each subspace ([n_subspaces, n_centroids, sub_dim])
+  """
+  random_state = np.random.RandomState(seed)
+  no, dim = data.shape
+  sample_idx = np.sort(random_state.permutation(no)[:sample_no])
+  
+  # Sample split into zero-padded subspaces ([sample_no, n_subspaces, sub_dim])
+  n_subspaces = int(np.ceil(dim / sub_dim))
+  sample = np.zeros([len(sample_idx), n_subspaces * sub_dim])
+  sample[:, :dim] = data[sample_idx]
+  sample = np.reshape(sample, [len(sample_idx), n_subspaces, sub_dim])
+  
+  n_centroids = min(n_centroids, len(sample_idx))
+  codebooks = np.zeros([n_subspaces, n_centroids, sub_dim])
+  
+  for m in range(n_subspaces):
+    points = sample[:, m, :]
+    centroids = points[random_state.permutation(len(points))[:n_centroids]]
+    for _ in range(n_iter):
+      assign = np.argmin(np.sum(centroids ** 2, axis = 1)[None, :] - 2 * points @ centroids.T, axis = 1)
+      counts = np.bincount(assign, minlength = n_centroids)
+      sums = np.zeros([n_centroids, sub_dim])
+      np.add.at(sums, assign, points)
+      # Empty clusters keep their centroid
+      centroids = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centroids)
+    codebooks[m] = centroids
+    
+  return codebooks
+
+
+def quantized_distance (query_data, ref_data, quantized_data, rerank = 10, tile_size = 1024, rerank_batch = 64):
+  """1-NN distance over quantized reference data with exact re-ranking.
+  
+  Asymmetric distances (exact query, reconstructed reference points) are computed 
+  tile by tile, decoding only one tile of codes at a time, and the rerank closest 
+  candidates of each query point are kept. The exact distance to these candidates 
+  is then computed from ref_data (which may be memory-mapped).
+  
+  Args:
+    - query_data: query data points ([query_no, dim])
+    - ref_data: reference data points ([ref_no, dim]), used for re-ranking
+    - quantized_data: QuantizedData of ref_data
+    - rerank: the number of candidates re-ranked exactly for each query point
+    - tile_size: the number of rows of each dataset in a distance tile
+    - rerank_batch: the number of query points re-ranked at a time
+    
+  Returns:
+    - distance: distance from (approximate) 1-NN reference point ([query_no,])
+  """
+  query_no, ref_no = len(query_data), len(ref_data)
+  rerank = min(rerank, ref_no)
+  tile_size = max(tile_size, rerank)
+  print(quantized_data.mode + ' codes: ' + str(np.round(quantized_data.nbytes / 2**20, 1)) + 'MB ' + 
+        '(reference data: ' + str(np.round(ref_data.nbytes / 2**20, 1)) + 'MB)')
+  
+  # Candidates of each query point
+  candidates = np.zeros([query_no, rerank], dtype = int)
+  
+  for i in range(0, query_no, tile_size):
+    query_tile = query_data[i:(i + tile_size)].astype(np.float64)
+    query_sq = np.einsum('ij,ij->i', query_tile, query_tile)
+    best_sq = np.full([len(query_tile), 0], np.inf)
+    best_idx = np.zeros([len(query_tile), 0], dtype = int)
+    
+    for j in range(0, ref_no, tile_size):
+      ref_tile = quantized_data.decode(slice(j, j + tile_size))
+      sq_dist = query_sq[:, None] + np.einsum('ij,ij->i', ref_tile, ref_tile)[None, :] - 2 * (query_tile @ ref_tile.T)
+      
+      # Keep the rerank closest candidates
+      sq_dist = np.concatenate([best_sq, sq_dist], axis = 1)
+      idx = np.concatenate([best_idx, np.tile(np.arange(j, j + len(ref_tile)), [len(query_tile), 1])], axis = 1)
+      top = np.argpartition(sq_dist, rerank - 1, axis = 1)[:, :rerank]
+      best_sq = np.take_along_axis(sq_dist, top, axis = 1)
+      best_idx = np.take_along_axis(idx, top, axis = 1)
+      
+    candidates[i:(i + tile_size)] = best_idx
+  
+  # Exact re-ranking
+  distance = np.zeros([query_no,])
+  for i in range(0, query_no, rerank_batch):
+    cand = candidates[i:(i + rerank_batch)]
+    # Rows are read once, in file order
+    rows, inverse = np.unique(cand, return_inverse = True)
+    cand_data = ref_data[rows].astype(np.float64)[np.reshape(inverse, cand.shape)]
+    diff = query_data[i:(i + rerank_batch)].astype(np.float64)[:, None, :] - cand_data
+    distance[i:(i + rerank_batch)] = np.sqrt(np.min(np.einsum('ijk,ijk->ij', diff, diff), axis = 1))
+    
+  return distance
+
+
+def knn_distances (query_data, ref_data, k, tile_size = 1024, n_jobs = 1):
+  """The k smallest distances of each query point in one tiled pass.
+  
+  Squared distances are computed tile by tile as in nn_distance, and the k smallest 
+  of each query point are kept with np.argpartition over the kept and the new 
+  distances, so the full distance matrix is never stored.
+  
+  Args:
+    - query_data: query data points ([query_no, dim])
+    - ref_data: reference data points ([ref_no, dim])
+    - k: the number of nearest reference points
+    - tile_size: the number of rows of each dataset in a distance tile
+    - n_jobs: the number of threads (-1 for all cores)
+    
+  Returns:
+    - distances: the k smallest distances of each query point, in increasing order ([query_no, k])
+  """
+  query_no, ref_no = len(query_data), len(ref_data)
+  k = min(k, ref_no)
+  tile_size = max(tile_size, k)
+  
+  query_sq = row_sq_norms(query_data, tile_size)
+  ref_sq = row_sq_norms(ref_data, tile_size)
+  
+  # Output initialization
+  distances = np.zeros([query_no, k])
+  
+  def tile_distances(i):
+    """k smallest distances of the query rows of the tile starting at row i."""
+    query_tile = query_data[i:(i + tile_size)].astype(np.float64)
+    best_sq = np.zeros([len(query_tile), 0])
+    
+    for j in range(0, ref_no, tile_size):
+      ref_tile = ref_data[j:(j + tile_size)].astype(np.float64)
+      sq_dist = query_sq[i:(i + tile_size), None] + ref_sq[None, j:(j + tile_size)] - 2 * (query_tile @ ref_tile.T)
+      sq_dist = np.concatenate([best_sq, sq_dist], axis = 1)
+      best_sq = np.partition(sq_dist, k - 1, axis = 1)[:, :k]
+      
+    distances[i:(i + tile_size)] = np.sqrt(np.maximum(np.sort(best_sq, axis = 1), 0))
+  
+  if n_jobs == -1:
+    n_jobs = os.cpu_count()
+  if n_jobs > 1:
+    with ThreadPoolExecutor(max_workers = n_jobs) as executor:
+      list(executor.map(tile_distances, range(0, query_no, tile_size)))
+  else:
+    for i in range(0, query_no, tile_size):
+      tile_distances(i)
+      
+  return distances
+
+
+def knn_statistic (distances, statistic = 'kth', ref_distances = None):
+  """Neighbour statistic of each query point from its k smallest distances.
+  
+  Statistics (smaller means closer to the generated data):
+    - kth: distance to the k-th nearest generated data point
+    - mean: mean distance to the k nearest generated data points
+    - ratio: k-th distance to the generated data divided by the k-th distance to 
+      the other enlarge data points (local density ratio)
+  
+  Args:
+    - distances: the k smallest distances to the generated data ([no, k])
+    - statistic: kth, mean or ratio
+    - ref_distances: the k smallest distances to the other enlarge data points ([no, k], ratio only)
+    
+  Returns:
+    - score: statistic of each query point ([no,])
+  """
+  assert statistic in ['kth', 'mean', 'ratio']
+  
+  if statistic == 'kth':
+    return distances[:, -1]
+  if statistic == 'mean':
+    return np.mean(distances, axis = 1)
+  
+  return distances[:, -1] / np.maximum(ref_distances[:, -1], 1e-12)
+
+
+###
+# Benchmark, run from the repository root: python -m seeker.knn.knn_seeker
+if __name__ == '__main__':
+  
+  def padded_data(no, seq_len = 100, dim = 70):
+    """Random features in [0, 1], front-padded with -1 to random sequence lengths."""
+    data = np.random.rand(no, seq_len, dim).astype(np.float32)
+    lengths = np.random.randint(1, seq_len + 1, no)
+    data[np.arange(seq_len)[None, :] < (seq_len - lengths)[:, None]] = -1
+    return data
+  
+  # Benchmark against the pairwise loop (1-NN distance of each enlarge data point)
+  enlarge_data = padded_data(1000)
+  generated_data = padded_data(800)
+  
+  start_time = time.time()
+  loop_distance = np.asarray([min([np.linalg.norm(enl - gen) for gen in generated_data]) 
+                              for enl in enlarge_data])
+  loop_time = time.time() - start_time
+  
+  start_time = time.time()
+  tile_distance = nn_distance(enlarge_data.reshape(1000, -1), generated_data.reshape(800, -1))
+  tile_time = time.time() - start_time
+  
+  # The loop accumulates in float32, the tiled engine in float64
+  assert np.allclose(loop_distance, tile_distance, rtol = 1e-6, atol = 0)
+  print('Pairwise loop: ' + str(np.round(loop_time, 2)) + 's, ' + 
+        'Tiled: ' + str(np.round(tile_time, 2)) + 's (' + str(np.round(loop_time / tile_time, 1)) + 'x)')